@@ -0,0 +1,296 @@
+"""Throughput and latency of Agency.handle_entity in a synthetic world.
+
+Builds a world of avatars, owned pets, lures and day-care pets, pushes a
+stream of Avatar and Bot entities through the agency against a stand-in
+session, and reports events per second, entity-to-REST-call latency and REST
+calls per event. Results are printed and can be saved as JSON to compare
+runs over time.
+
+    uv run python benchmarks/bench_agency.py --avatars 500 --owned-pets 5000 \\
+        --output results.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import subprocess
+import time
+
+import pets.update_queues
+from pets import Agency
+from pets.constants import DAY_CARE_CENTER, GENIE_EMOJI, PETS, SPAWN_POINTS
+from pets.rate_limit import RateLimitedSession, RateLimiter
+from pets.stand_in import StandInSession
+
+GENIE_ID = 1
+
+
+def person_name(avatar_id):
+    return f"Person {avatar_id}"
+
+
+def random_pos():
+    return {"x": random.randrange(200), "y": random.randrange(100)}
+
+
+def build_world(args):
+    """Return (bots, avatars, owners) for a world of the requested size."""
+    avatars = {
+        avatar_id: {
+            "type": "Avatar",
+            "id": avatar_id,
+            "person_name": person_name(avatar_id),
+            "pos": random_pos(),
+        }
+        for avatar_id in range(1000, 1000 + args.avatars)
+    }
+
+    bots = [
+        {
+            "type": "Bot",
+            "id": GENIE_ID,
+            "name": "Pet Agency Genie",
+            "emoji": GENIE_EMOJI,
+            "pos": {"x": 60, "y": 15},
+        }
+    ]
+    pet_ids = iter(range(100_000, 10_000_000))
+
+    for (x, y), species in zip(SPAWN_POINTS, random.sample(PETS, len(SPAWN_POINTS))):
+        bots.append(
+            {
+                "type": "Bot",
+                "id": next(pet_ids),
+                "name": species["name"],
+                "emoji": species["emoji"],
+                "pos": {"x": x, "y": y},
+            }
+        )
+
+    owners = {}
+    for index in range(args.owned_pets):
+        owner = random.choice(list(avatars))
+        species = random.choice(PETS)
+        in_day_care = index < args.day_care
+        text = "Please don't forget about me!" if in_day_care else "💖"
+        pet_id = next(pet_ids)
+        owners[pet_id] = owner
+        bots.append(
+            {
+                "type": "Bot",
+                "id": pet_id,
+                "name": f"{person_name(owner)}'s {species['name']}",
+                "emoji": species["emoji"],
+                "pos": (
+                    DAY_CARE_CENTER.random_point() if in_day_care else random_pos()
+                ),
+                "message": {
+                    "mentioned_entity_ids": [owner],
+                    "text": f"@**{person_name(owner)}** {text}",
+                },
+            }
+        )
+
+    return bots, avatars, owners
+
+
+def lure_pets(agency, avatars, owners, count):
+    """Have random avatars lure random owned pets away. Returns pet -> petter."""
+    lurers = {}
+    pet_directory = agency.agency_sync.pet_directory
+    for pet_id in random.sample(list(owners), min(count, len(owners))):
+        petter = random.choice(list(avatars.values()))
+        agency.agency_sync.lured.add(pet_directory[pet_id], petter)
+        lurers[pet_id] = petter["id"]
+    return lurers
+
+
+def entity_stream(args, avatars, owners):
+    sent_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+    avatar_ids = list(avatars)
+    pet_ids = list(owners)
+
+    for index in range(args.events):
+        roll = random.random()
+        if roll < args.bot_fraction and pet_ids:
+            pet_id = random.choice(pet_ids)
+            yield {
+                "type": "Bot",
+                "id": pet_id,
+                "name": f"{person_name(owners[pet_id])}'s pet",
+                "pos": random_pos(),
+            }
+            continue
+
+        avatar = dict(avatars[random.choice(avatar_ids)])
+        avatar["pos"] = {
+            "x": avatar["pos"]["x"] + random.choice((-1, 0, 1)),
+            "y": avatar["pos"]["y"] + random.choice((-1, 0, 1)),
+        }
+        avatars[avatar["id"]] = avatar
+
+        if roll > 1 - args.mention_fraction:
+            avatar["message"] = {
+                "mentioned_entity_ids": [GENIE_ID],
+                "sent_at": (sent_at + datetime.timedelta(seconds=index)).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                "text": "thanks!",
+            }
+        yield avatar
+
+
+class LatencyTracker:
+    """Time from the oldest not-yet-served entity of an avatar to the REST
+    call that serves it."""
+
+    def __init__(self, pet_avatars):
+        self.pet_avatars = pet_avatars
+        self.waiting_since = {}
+        self.latencies = []
+
+    def received(self, entity):
+        if entity["type"] == "Avatar":
+            self.waiting_since.setdefault(entity["id"], time.monotonic())
+
+    def on_call(self, method, resource, resource_id, payload):
+        if method == "patch" and resource == "bots":
+            avatar_id = self.pet_avatars.get(resource_id)
+        elif method == "post" and resource == "messages":
+            avatar_id = self.message_recipient(payload)
+        else:
+            return
+
+        started = self.waiting_since.pop(avatar_id, None)
+        if started is not None:
+            self.latencies.append(time.monotonic() - started)
+
+    def message_recipient(self, payload):
+        # "@**Person 1234** ..." -> 1234
+        name = payload["text"].split("**")[1]
+        return int(name.rsplit(" ", 1)[1])
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    random.seed(args.seed)
+    pets.update_queues.SLEEP_AFTER_UPDATE = args.sleep_after_update
+
+    bots, avatars, owners = build_world(args)
+    tracker = LatencyTracker(dict(owners))
+    stand_in = StandInSession(bots, latency=args.latency, on_call=tracker.on_call)
+    session = (
+        RateLimitedSession(stand_in, RateLimiter(rate=args.rate_limit))
+        if args.rate_limit
+        else stand_in
+    )
+
+    agency = await Agency.create(session)
+    tracker.pet_avatars.update(lure_pets(agency, avatars, owners, args.lures))
+    calls_at_start = stand_in.total_calls()
+
+    entities = list(entity_stream(args, avatars, owners))
+    interval = 1 / args.input_rate if args.input_rate else 0
+
+    started = time.monotonic()
+    for index, entity in enumerate(entities):
+        tracker.received(entity)
+        await agency.handle_entity(entity)
+        if interval:
+            await asyncio.sleep(max(0, started + index * interval - time.monotonic()))
+    ingested = time.monotonic()
+    await agency.close()
+    finished = time.monotonic()
+
+    rest_calls = stand_in.total_calls() - calls_at_start
+    return {
+        "events": len(entities),
+        "ingest_seconds": ingested - started,
+        "total_seconds": finished - started,
+        "events_per_second": len(entities) / (finished - started),
+        "latency_p50": tracker.percentile(0.5),
+        "latency_p99": tracker.percentile(0.99),
+        "latency_samples": len(tracker.latencies),
+        "rest_calls": rest_calls,
+        "rest_calls_per_event": rest_calls / len(entities),
+        "rest_calls_by_kind": {
+            f"{method} {resource}": count
+            for (method, resource), count in sorted(stand_in.calls.items())
+        },
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--avatars", type=int, default=200)
+    parser.add_argument("--owned-pets", type=int, default=2000)
+    parser.add_argument("--lures", type=int, default=50)
+    parser.add_argument("--day-care", type=int, default=200)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument(
+        "--bot-fraction", type=float, default=0.3, help="share of Bot entities"
+    )
+    parser.add_argument(
+        "--mention-fraction",
+        type=float,
+        default=0.01,
+        help="share of Avatar entities that thank the genie",
+    )
+    parser.add_argument(
+        "--input-rate",
+        type=float,
+        default=0,
+        help="entities per second to feed in (default: as fast as possible)",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per stand-in REST call"
+    )
+    parser.add_argument("--sleep-after-update", type=float, default=0.0)
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0,
+        help="wrap the session in a RateLimiter with this budget",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report = {
+        "benchmark": "agency",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Memory retained by the agency's in-process state as the world grows.
+
+Fills an AgencySync through its real code paths (loading bots, avatars
+moving, pets being lured) and an UpdateQueues with one pending update per pet,
+at each requested scale, and reports the tracemalloc peak, retained bytes per
+pet and per avatar, and the largest allocation sites.
+
+    uv run python benchmarks/bench_memory.py --scales 1000 10000 100000
+
+Save a run with --output and pass it back with --baseline to fail when bytes
+per pet or per avatar grow by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import random
+import sys
+import tracemalloc
+
+import pets.avatars
+from pets.agency_sync import AgencySync
+from pets.constants import PETS
+from pets.update_queues import UpdateQueues
+
+LURED_FRACTION = 0.1
+
+
+def person_name(avatar_id):
+    return f"Person {avatar_id}"
+
+
+def random_pos():
+    return {"x": random.randrange(500), "y": random.randrange(500)}
+
+
+def make_avatars(count):
+    return [
+        {
+            "type": "Avatar",
+            "id": avatar_id,
+            "person_name": person_name(avatar_id),
+            "pos": random_pos(),
+        }
+        for avatar_id in range(1, count + 1)
+    ]
+
+
+def make_bots(count, avatars):
+    bots = []
+    for pet_id in range(1_000_000, 1_000_000 + count):
+        owner = random.choice(avatars)
+        species = random.choice(PETS)
+        bots.append(
+            {
+                "type": "Bot",
+                "id": pet_id,
+                "name": f"{owner['person_name']}'s {species['name']}",
+                "emoji": species["emoji"],
+                "pos": random_pos(),
+                "message": {
+                    "mentioned_entity_ids": [owner["id"]],
+                    "text": f"@**{owner['person_name']}** 💖",
+                },
+            }
+        )
+    return bots
+
+
+def retained():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def fill_update_queues(sync):
+    async def send(queue_id, update):
+        pass
+
+    update_queues = UpdateQueues(send)
+    for pet in sync.pet_directory.all_owned():
+        update_queues.add_update(pet.id, {"x": pet.pos["x"], "y": pet.pos["y"]})
+    usage = retained()
+
+    # The workers haven't run yet, so the queues are still full.
+    for worker in update_queues.workers:
+        worker.cancel()
+    await asyncio.gather(*update_queues.workers, return_exceptions=True)
+    return usage, update_queues.depth()
+
+
+def measure(scale, top):
+    random.seed(scale)
+    pets.avatars.MAX_AVATARS = scale
+
+    # Serialise the inputs before tracing and decode them inside it, as the
+    # agency would: pets and avatars keep parts of them (positions, names),
+    # which must be counted. The peak includes the decoded bot listing.
+    avatars = make_avatars(scale)
+    bots_json = json.dumps(make_bots(scale, avatars))
+    avatars_json = json.dumps(avatars)
+    del avatars
+
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = retained()
+    before = tracemalloc.take_snapshot()
+
+    sync = AgencySync()
+    sync.load(json.loads(bots_json))
+    after_pets = retained()
+
+    for avatar in json.loads(avatars_json):
+        for _ in sync.handle_avatar(avatar):
+            pass
+    after_avatars = retained()
+
+    for pet in random.sample(
+        list(sync.pet_directory.all_owned()), int(scale * LURED_FRACTION)
+    ):
+        sync.lured.add(pet, {"id": random.randint(1, scale)})
+    after_lures = retained()
+
+    after_queues, queue_depth = asyncio.run(fill_update_queues(sync))
+
+    sites = tracemalloc.take_snapshot().compare_to(before, "lineno")[:top]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    lures = len(sync.lured)
+    return {
+        "scale": scale,
+        "pets": len(sync.pet_directory.ids()),
+        "avatars": len(sync.avatars),
+        "lures": lures,
+        "queued_updates": queue_depth,
+        "peak_bytes": peak - start,
+        "retained_bytes": after_lures - start,
+        "bytes_per_pet": (after_pets - start) / scale,
+        "bytes_per_avatar": (after_avatars - after_pets) / len(sync.avatars),
+        "bytes_per_lure": (after_lures - after_avatars) / lures if lures else 0,
+        "bytes_per_queued_update": (
+            (after_queues - after_lures) / queue_depth if queue_depth else 0
+        ),
+        "top_sites": [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "bytes": stat.size_diff,
+                "blocks": stat.count_diff,
+            }
+            for stat in sites
+        ],
+    }
+
+
+def regressions(results, baseline, tolerance):
+    previous = {result["scale"]: result for result in baseline["results"]}
+    for result in results:
+        old = previous.get(result["scale"])
+        if not old:
+            continue
+        for key in ("bytes_per_pet", "bytes_per_avatar"):
+            if result[key] > old[key] * (1 + tolerance):
+                yield f"{key} at {result['scale']}: {old[key]:.0f} -> {result[key]:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--top", type=int, default=10, help="allocation sites to show")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = [measure(scale, args.top) for scale in args.scales]
+
+    print(
+        f"{'scale':>8} {'peak MiB':>9} {'B/pet':>7} {'B/avatar':>9} "
+        f"{'B/lure':>7} {'B/update':>9}"
+    )
+    for result in results:
+        print(
+            f"{result['scale']:>8} {result['peak_bytes'] / 2**20:>9.1f} "
+            f"{result['bytes_per_pet']:>7.0f} {result['bytes_per_avatar']:>9.0f} "
+            f"{result['bytes_per_lure']:>7.0f} "
+            f"{result['bytes_per_queued_update']:>9.0f}"
+        )
+
+    largest = results[-1]
+    print(f"\nLargest allocation sites at {largest['scale']}:")
+    for site in largest["top_sites"]:
+        print(f"{site['bytes'] / 2**20:>9.2f} MiB {site['blocks']:>9} {site['site']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(
+                {
+                    "benchmark": "memory",
+                    "python": platform.python_version(),
+                    "results": results,
+                },
+                output,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            problems = list(
+                regressions(results, json.load(baseline_file), args.tolerance)
+            )
+        for problem in problems:
+            print(f"Regression: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Cost of pets.parser.parse_command over the parser corpus.
+
+Compares the compiled dispatcher with the old parser, which tried the
+adoption regex and then each command pattern in turn with re.search.
+
+    uv run python benchmarks/bench_parser.py
+"""
+
+import argparse
+import json
+import re
+import timeit
+from pathlib import Path
+
+from pets.parser import ADOPTION, COMMANDS, parse_adoption, parse_command
+
+CORPUS = Path(__file__).parent.parent / "tests" / "parser_corpus.json"
+
+
+def sequential_parse_command(message):
+    """The parser as it was before the dispatcher, kept for comparison."""
+    adoption_match = parse_adoption(message)
+    if adoption_match:
+        return ("adoption", adoption_match)
+
+    for pattern, command in COMMANDS.items():
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            return (command, match.groups())
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as corpus_file:
+        messages = [message for message, _ in json.load(corpus_file)]
+
+    # Mentions are usually prefixed with the genie's name.
+    messages += [f"@**Pet Agency Genie** {message}" for message in messages]
+
+    for message in messages:
+        assert parse_command(message) == sequential_parse_command(message), message
+
+    print(
+        f"{len(messages)} messages, {len(COMMANDS) + 1} commands ({ADOPTION!r} first)"
+    )
+    for parse in (sequential_parse_command, parse_command):
+        best = min(
+            timeit.repeat(
+                lambda: [parse(message) for message in messages],
+                number=args.number,
+                repeat=args.repeat,
+            )
+        )
+        per_message = best / args.number / len(messages) * 1e9
+        print(f"{parse.__name__:<26} {per_message:>8.0f} ns/message")
+
+
+if __name__ == "__main__":
+    main()
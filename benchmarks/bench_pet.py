@@ -0,0 +1,110 @@
+"""Per-pet memory and attribute access cost of pets.pet.Pet.
+
+Compares the slotted Pet with the old model, which kept the whole bot json
+alive and indexed into it on every attribute access.
+
+    uv run python benchmarks/bench_pet.py --pets 100000
+"""
+
+import argparse
+import gc
+import random
+import timeit
+import tracemalloc
+
+from pets.constants import PETS
+from pets.pet import Pet
+
+
+class DictBackedPet:
+    """The Pet model as it was before it was slotted, kept for comparison."""
+
+    def __init__(self, bot_json):
+        self.bot_json = bot_json
+        self.pos = bot_json["pos"]
+        self.is_in_day_care_center = False
+        message = bot_json.get("message")
+        if message and message.get("mentioned_entity_ids"):
+            self.owner = message["mentioned_entity_ids"][0]
+            if "forget" in message.get("text", ""):
+                self.is_in_day_care_center = True
+        else:
+            self.owner = None
+
+    @property
+    def type(self):
+        return self.name.split(" ")[-1]
+
+    @property
+    def id(self):
+        return self.bot_json["id"]
+
+    @property
+    def emoji(self):
+        return self.bot_json["emoji"]
+
+    @property
+    def name(self):
+        return self.bot_json["name"]
+
+
+def bot_json(pet_id):
+    """A websocket-sized bot payload for an owned pet."""
+    species = random.choice(PETS)
+    owner = random.randrange(5000)
+    return {
+        "type": "Bot",
+        "id": pet_id,
+        "name": f"Person {owner}'s {species['name']}",
+        "emoji": species["emoji"],
+        "pos": {"x": random.randrange(200), "y": random.randrange(200)},
+        "direction": "right",
+        "can_be_mentioned": False,
+        "app": {"id": 1, "name": "Pets"},
+        "message": {
+            "mentioned_entity_ids": [owner],
+            "text": f"@**Person {owner}** {species.get('noise', '💖')}",
+            "sent_at": "2033-11-14T12:34:56Z",
+        },
+    }
+
+
+def measure_memory(model, count):
+    random.seed(1)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    # The bot json is dropped once the pet is built, as it is in the agency.
+    pets = [model(bot_json(pet_id)) for pet_id in range(count)]
+    gc.collect()
+
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return pets, retained / count
+
+
+def measure_access(pets, repeat):
+    def touch():
+        for pet in pets:
+            pet.id, pet.emoji, pet.type, pet.name
+
+    best = min(timeit.repeat(touch, number=1, repeat=repeat))
+    return best / len(pets) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pets", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'model':<16} {'bytes/pet':>10} {'ns/access':>10}")
+    for model in (DictBackedPet, Pet):
+        pets, bytes_per_pet = measure_memory(model, args.pets)
+        ns_per_access = measure_access(pets, args.repeat)
+        print(f"{model.__name__:<16} {bytes_per_pet:>10.0f} {ns_per_access:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
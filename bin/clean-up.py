@@ -1,9 +1,10 @@
 import asyncio
 import rctogether
+from pets import transport
 
 
 async def main():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         # Refuse to clean up pets.
         if session.rc_app_id.startswith("c37fb"):
             raise ValueError("No! People care about pets")
@@ -1,12 +1,13 @@
 import asyncio
 import rctogether
 import random
+from pets import transport
 
 COSTUMES = ["👻", "🦇", "🧟", "🎃"]
 
 
 async def main():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         bots = await rctogether.bots.get(session)
         for bot in bots:
             if bot["emoji"] in COSTUMES:
@@ -17,7 +18,6 @@ async def main():
             costume = random.choice(COSTUMES)
             print(costume)
             await rctogether.bots.update(session, bot["id"], {"emoji": costume})
-            await asyncio.sleep(0.2)
 
 
 if __name__ == "__main__":
@@ -3,10 +3,11 @@ import asyncio
 import json
 from collections import Counter
 import rctogether
+from pets import transport
 
 
 async def fetch_live_data():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         return await rctogether.bots.get(session)
 
 
@@ -2,10 +2,11 @@ import argparse
 import asyncio
 from collections import defaultdict
 import rctogether
+from pets import transport
 
 
 async def fetch_live_data():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         return await rctogether.bots.get(session)
 
 
@@ -26,7 +27,7 @@ async def cleanup_overlapping(pets_to_delete, dry_run=True):
             print(f"  {name:<20} {emoji:<10} ({x}, {y}){'':<7} {pet_id}")
         print(f"\n[DRY RUN] Total: {len(pets_to_delete)} bots would be deleted")
     else:
-        async with rctogether.RestApiSession() as session:
+        async with transport.connect() as session:
             for pet in pets_to_delete:
                 name = pet.get("name", "Unknown")
                 pet_id = pet.get("id", "?")
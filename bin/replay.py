@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Replay recorded entities into an agency that talks to a stand-in server."""
+
+import argparse
+import asyncio
+import json
+import time
+
+from pets import Agency
+from pets.recording import read, recording_files, replay
+from pets.stand_in import StandInSession
+
+
+async def main(paths, bots, speed, latency):
+    session = StandInSession(bots, latency=latency)
+    agency = await Agency.create(session)
+    calls_at_start = session.total_calls()
+
+    started = time.monotonic()
+    result = await replay(agency, read(paths), speed=speed)
+    await agency.close()
+    elapsed = time.monotonic() - started
+
+    print(
+        f"Replayed {result['entities']} entities in {elapsed:.1f}s "
+        f"({result['entities'] / elapsed:.0f}/s), "
+        f"at worst {result['max_behind']:.2f}s behind schedule"
+    )
+    print(f"REST calls: {session.total_calls() - calls_at_start}")
+    for (method, resource), count in sorted(session.calls.items()):
+        print(f"  {method} {resource}: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "recordings",
+        nargs="+",
+        help="recording files, or the PETS_RECORDING prefix they were written with",
+    )
+    parser.add_argument(
+        "--bots",
+        help="JSON bot listing to start from, as written by save_bots.py or PETS_SNAPSHOT",
+    )
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument(
+        "--speed", type=float, default=1.0, help="replay speed, 2 is twice as fast"
+    )
+    speed.add_argument(
+        "--max", action="store_const", dest="speed", const=0, help="replay flat out"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per stand-in REST call"
+    )
+    args = parser.parse_args()
+
+    paths = []
+    for recording in args.recordings:
+        paths.extend(
+            [recording] if recording.endswith(".gz") else recording_files(recording)
+        )
+
+    bots = []
+    if args.bots:
+        with open(args.bots, encoding="utf-8") as bots_file:
+            bots = json.load(bots_file)
+
+    asyncio.run(main(paths, bots, args.speed, args.latency))
@@ -1,6 +1,7 @@
 import asyncio
 import rctogether
 from pets.constants import PETS
+from pets import transport
 
 EMOJI = {pet["name"]: pet["emoji"] for pet in PETS}
 EMOJI["sheep"] = "🐑"
@@ -8,7 +9,7 @@ EMOJI["duck"] = "🦆"
 
 
 async def main():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         bots = await rctogether.bots.get(session)
         for bot in bots:
             if bot["emoji"] == "🧞":
@@ -23,7 +24,6 @@ async def main():
                 await rctogether.bots.update(
                     session, bot["id"], {"emoji": original_emoji}
                 )
-                await asyncio.sleep(0.2)
 
 
 if __name__ == "__main__":
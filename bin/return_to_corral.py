@@ -6,13 +6,13 @@ import asyncio
 
 import rctogether
 from pets.constants import CORRAL, GENIE_EMOJI
+from pets import transport
 
-RATE_LIMITING_DELAY = 0.1
 MAX_RETRIES = 5
 
 
 async def main(dry_run=False):
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         bots = await rctogether.bots.get(session)
 
         owned_pets = [
@@ -40,20 +40,15 @@ async def main(dry_run=False):
                         await rctogether.bots.update(
                             session, pet["id"], corral_position
                         )
-                        await asyncio.sleep(RATE_LIMITING_DELAY)
                         break
-                    except rctogether.api.HttpError as e:
-                        if e.args[0] == 422 and "must not be in a block" in e.args[1]:
+                    except transport.BlockedPosition:
+                        print(
+                            f"  Position blocked, retrying... (attempt {attempt + 1}/{MAX_RETRIES})"
+                        )
+                        if attempt == MAX_RETRIES - 1:
                             print(
-                                f"  Position blocked, retrying... (attempt {attempt + 1}/{MAX_RETRIES})"
+                                f"  Failed to move {pet['name']} after {MAX_RETRIES} attempts"
                             )
-                            if attempt == MAX_RETRIES - 1:
-                                print(
-                                    f"  Failed to move {pet['name']} after {MAX_RETRIES} attempts"
-                                )
-                            continue
-                        else:
-                            raise
             else:
                 corral_position = CORRAL.random_point()
                 print(f"Moving {pet['name']} to corral at {corral_position}")
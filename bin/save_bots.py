@@ -1,10 +1,11 @@
 import asyncio
 import json
 import rctogether
+from pets import transport
 
 
 async def main():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         bots = await rctogether.bots.get(session)
         print(json.dumps(bots))
 
@@ -1,15 +1,53 @@
 import asyncio
-import rctogether
 
-from . import Agency
+from . import Agency, metrics, transport
+from .constants import METRICS_PORT, RECORDING_PATH, SNAPSHOT_PATH, TRACE_PATH
+from .profiler import Profiler
+from .recording import Recorder, recorded
+from .subscription import supervised_subscription
+from .tracing import Tracer
 
 
 async def main():
-    async with rctogether.RestApiSession() as session:
-        agency = await Agency.create(session)
+    tracer = Tracer(TRACE_PATH) if TRACE_PATH else None
 
-        async for entity in rctogether.WebsocketSubscription():
-            await agency.handle_entity(entity)
+    async with transport.connect(
+        metered=bool(METRICS_PORT), traced=bool(TRACE_PATH)
+    ) as session:
+        agency = await Agency.create(
+            session, snapshot_path=SNAPSHOT_PATH, tracer=tracer
+        )
+
+        background_tasks = set()
+
+        # Send SIGUSR2 to profile the running process.
+        profiler = Profiler(in_flight=lambda: session.in_flight)
+        profiler.install_signal_handler()
+
+        if METRICS_PORT:
+            metrics.watch_agency(agency)
+            metrics.watch_rate_limiter(session.limiter)
+            metrics.watch_breakers(session.breakers)
+            await metrics.serve(
+                METRICS_PORT, handlers={"/profile": profiler.handle_request}
+            )
+            # Keep a reference, or the task may be garbage collected.
+            background_tasks.add(asyncio.create_task(metrics.monitor_loop_lag()))
+
+        entities = supervised_subscription(on_reconnect=agency.resync)
+        if RECORDING_PATH:
+            entities = recorded(entities, Recorder(RECORDING_PATH))
+
+        try:
+            async for entity in entities:
+                await agency.handle_entity(entity)
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            await agency.close()
+            if tracer:
+                tracer.close()
 
 
 if __name__ == "__main__":
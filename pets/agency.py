@@ -1,23 +1,29 @@
 """Async API wrapper for the pet agency."""
 
 import asyncio
+import collections
 import datetime
 import random
 
+import aiohttp
 import rctogether
 
+from . import priority, snapshot, transport
 from .agency_sync import AgencySync
+from .pipeline import IngestPipeline
+from .timer_wheel import TimerWheel
 from .update_queues import UpdateQueues
-from . import update_queues
 from .constants import PET_BOREDOM_TIMES, CORRAL
 
 
 def parse_dt(date_string):
-    return datetime.datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+    return datetime.datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=datetime.timezone.utc
+    )
 
 
 async def reset_agency():
-    async with rctogether.RestApiSession() as session:
+    async with transport.connect() as session:
         for bot in await rctogether.bots.get(session):
             if bot["emoji"] == "🧞":
                 pass
@@ -33,13 +39,21 @@ class Agency:
             (session) -> Agency
         handle_entity
             (json_blob)
+        stats
+            () -> dict
     """
 
-    def __init__(self, session):
+    def __init__(self, session, snapshot_path=None, tracer=None):
         self.session = session
+        self.snapshot_path = snapshot_path
+        self.tracer = tracer
+        self._resync_task = None
         self.processed_message_dt = datetime.datetime.now(datetime.timezone.utc)
+        self.entities_received = collections.Counter()
         self.agency_sync = AgencySync()
-        self._update_queues = UpdateQueues(self.queue_iterator)
+        self._update_queues = UpdateQueues(self.send_update)
+        self._boredom = TimerWheel(self.handle_boredom)
+        self._pipeline = IngestPipeline(self.process_entity, self.apply_event)
 
     async def __aenter__(self):
         return self
@@ -48,43 +62,88 @@ class Agency:
         await self.close()
 
     @classmethod
-    async def create(cls, session):
-        bots = await rctogether.bots.get(session)
+    async def create(cls, session, snapshot_path=None, tracer=None):
+        agency = cls(session, snapshot_path, tracer)
 
-        agency = cls(session)
+        bots = snapshot.load(snapshot_path) if snapshot_path else None
+        if bots is not None:
+            # Serve from the snapshot straight away, and catch up with the
+            # server in the background.
+            agency.agency_sync.load(bots)
+            agency._resync_task = asyncio.create_task(agency.resync_in_background())
+            return agency
 
-        for event in agency.agency_sync.start(bots):
+        bots = await agency.fetch_bots()
+
+        for event in list(agency.agency_sync.start(bots)):
             await agency.apply_event(event)
 
         return agency
 
-    async def queue_iterator(self, queue, pet_id):
+    async def fetch_bots(self):
+        bots = await rctogether.bots.get(self.session)
+        if self.snapshot_path:
+            snapshot.save(self.snapshot_path, bots)
+        return bots
+
+    async def resync_in_background(self):
+        try:
+            await self.resync()
+        except (
+            rctogether.api.HttpError,
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+        ) as exc:
+            print(f"Resync failed, still running from snapshot: {exc!r}")
+
+    async def resync(self):
+        with self.agency_sync.fetching() as changed:
+            bots = await self.fetch_bots()
+
+        # Work out every event before applying any: applying them yields to
+        # the pipeline, which keeps changing the directory.
+        events = list(self.agency_sync.reconcile(bots, changed))
+        for event in events:
+            await self.apply_event(event)
+
+    def reset_boredom(self, pet_id):
+        self._boredom.reset(pet_id, random.randint(*PET_BOREDOM_TIMES))
+
+    def forget_boredom(self, pet_id):
+        self._boredom.cancel(pet_id)
+
+    def handle_boredom(self, pet_id):
         pet = self.agency_sync.pet_directory.get(pet_id)
+        if not pet:
+            return
 
-        updates = update_queues.deduplicated_updates(queue)
-
-        while True:
-            next_update = asyncio.Task(updates.__anext__())
-            while True:
-                try:
-                    update = await asyncio.wait_for(
-                        asyncio.shield(next_update),
-                        timeout=random.randint(*PET_BOREDOM_TIMES),
-                    )
-                    yield update
-                    break
-                except asyncio.TimeoutError:
-                    if pet and pet.owner and not pet.is_in_day_care_center:
-                        yield rctogether.bots.update(
-                            self.session, pet.id, CORRAL.random_point()
-                        )
-                except StopAsyncIteration:
-                    return
+        if pet.owner and not pet.is_in_day_care_center:
+            self._update_queues.add_update(
+                pet.id, CORRAL.random_point(), priority.WANDER
+            )
+        self.reset_boredom(pet_id)
 
     async def close(self):
+        if self._resync_task:
+            await self._resync_task
+        await self._pipeline.close()
+        self._boredom.clear()
         await self._update_queues.close()
 
-    async def handle_mention(self, adopter, message):
+    def stats(self):
+        agency_sync = self.agency_sync
+        return {
+            **self._pipeline.stats(),
+            "entities_received": dict(self.entities_received),
+            "update_queues": self._update_queues.stats(),
+            "boredom_timers": len(self._boredom),
+            "pets": len(agency_sync.pet_directory.ids()),
+            "avatars": len(agency_sync.avatars),
+            "lured_pets": len(agency_sync.lured),
+            "commands_refused": agency_sync.command_budget.refused,
+        }
+
+    def handle_mention(self, adopter, message):
         mentioned_entity_ids = message["mentioned_entity_ids"]
 
         message_dt = parse_dt(message["sent_at"])
@@ -92,12 +151,18 @@ class Agency:
             return
         self.processed_message_dt = message_dt
 
-        for event in self.agency_sync.handle_mention(
+        yield from self.agency_sync.handle_mention(
             adopter, message, mentioned_entity_ids
-        ):
-            await self.apply_event(event)
+        )
+
+    async def send_update(self, pet_id, update):
+        await rctogether.bots.update(self.session, pet_id, update)
 
     async def apply_event(self, event):
+        with priority.use(priority.of_event(event)):
+            await self._apply_event(event)
+
+    async def _apply_event(self, event):
         match event[0]:
             case "send_message":
                 recipient, message_text, sender = event[1:]
@@ -108,15 +173,19 @@ class Agency:
                 )
             case "update_pet":
                 pet, update = event[1:]
-                await self._update_queues.add_task(
-                    pet.id, rctogether.bots.update(self.session, pet.id, update)
-                )
+                self._update_queues.add_update(pet.id, update)
+                self.reset_boredom(pet.id)
             case "sync_update_pet":
                 await rctogether.bots.update(self.session, event[1].id, event[2])
             case "delete_pet":
                 pet = event[1]
-                await self._update_queues.add_task(pet.id, None)
+                self.forget_boredom(pet.id)
+                self._update_queues.remove(pet.id)
                 await rctogether.bots.delete(self.session, pet.id)
+            case "forget_pet":
+                pet = event[1]
+                self.forget_boredom(pet.id)
+                self._update_queues.remove(pet.id)
             case "create_pet":
                 pet = await rctogether.bots.create(self.session, **event[1])
                 self.agency_sync.handle_created(pet)
@@ -124,13 +193,28 @@ class Agency:
                 raise ValueError(f"Unknown event: {event}")
 
     async def handle_entity(self, entity):
+        self.entities_received[entity["type"]] += 1
+        trace = self.tracer.start(entity) if self.tracer else None
+        # The entity is processed later, so take a copy in case the caller
+        # reuses the dict.
+        await self._pipeline.put(dict(entity), trace)
+
+    def process_entity(self, entity):
+        """Run the game logic for an entity.
+
+        Returns (avatar_id, event) pairs; events for the same avatar are applied
+        in order, events for different avatars may be applied concurrently.
+        """
+        events = []
+
         if entity["type"] == "Avatar":
             message = entity.get("message")
             if message:
-                await self.handle_mention(entity, message)
+                events.extend(self.handle_mention(entity, message))
 
-            for event in self.agency_sync.handle_avatar(entity):
-                await self.apply_event(event)
+            events.extend(self.agency_sync.handle_avatar(entity))
 
         if entity["type"] == "Bot":
             self.agency_sync.handle_bot(entity)
+
+        return [(entity["id"], event) for event in events]
@@ -1,24 +1,29 @@
 """Synchronous game logic engine for the pet agency."""
 
+import contextlib
 import random
+import time
 
+from .avatars import AvatarCache
+from .command_budget import CommandBudget, ALLOW, WARN
+from .keywords import MANNERS_MATCHER
 from .pet import Pet, owned_pet_name
 from .pet_directory import PetDirectory
 from .lured import Lured
 from .parser import parse_command
-from .geometry import offset_position, is_adjacent, DELTAS
+from .geometry import offset_position, position_tuple, SpatialGrid, DELTAS
 from .constants import (
     GENIE_NAME,
     GENIE_EMOJI,
     GENIE_HOME,
     MYSTERY_HOME,
-    MANNERS,
     PETS,
     NOISES,
     HELP_TEXT,
     SAD_MESSAGE_TEMPLATES,
     THANKS_RESPONSES,
     DAY_CARE_CENTER,
+    RESTOCK_WINDOW_SECONDS,
 )
 
 
@@ -47,13 +52,22 @@ class AgencySync:
         self.pet_directory = PetDirectory()
         self.genie = None
         self.lured = Lured()
-        self.avatars = {}
+        self.avatar_positions = SpatialGrid()
+        self.avatars = AvatarCache(on_evict=self.avatar_positions.remove)
         self.genie = None
+        self.command_budget = CommandBudget()
+        self.restocked_at = None
+        self.fetches = []
 
     def start(self, bots):
+        self.load(bots)
+        yield from self.restore_fixtures()
+
+    def load(self, bots):
         for bot_json in bots:
             self.handle_created(bot_json)
 
+    def restore_fixtures(self):
         if not self.genie:
             yield (
                 "create_pet",
@@ -82,7 +96,7 @@ class AgencySync:
         return HELP_TEXT
 
     def handle_adoption(self, adopter, text, pet_type):
-        if not any(please in text.lower() for please in MANNERS):
+        if not MANNERS_MATCHER.search(text.lower()):
             yield "No please? Our pets are only available to polite homes."
             return
 
@@ -99,21 +113,22 @@ class AgencySync:
             return
 
         if pet_type == "seahorse":
-            try:
-                pet = random.choice(list(self.pet_directory.available()))
-                pet.bot_json["name"] = "seahorse"
-            except IndexError:
+            pet = self.pet_directory.random_available()
+            if not pet:
                 yield "You already have too many seahorses."
                 return
+            self.changed(pet.id)
+            self.pet_directory.rename(pet, "seahorse")
         elif pet_type == "surprise" or pet_type == "mystery":
             if not self.pet_directory.mystery_pets:
                 yield "Sorry, we don't have any mystery boxes at the moment."
                 return
             pet = self.pet_directory.mystery_pets.pop()
+            self.changed(pet.id)
 
             revealed_pet_type = random.choice(PETS)
-            pet.bot_json["emoji"] = revealed_pet_type["emoji"]
-            pet.bot_json["name"] = revealed_pet_type["name"]
+            pet.emoji = revealed_pet_type["emoji"]
+            pet.name = revealed_pet_type["name"]
 
             yield (
                 "sync_update_pet",
@@ -135,24 +150,23 @@ class AgencySync:
                 },
             )
         elif pet_type == "pet":
-            try:
-                pet = random.choice(list(self.pet_directory.available()))
-            except IndexError:
+            pet = self.pet_directory.random_available()
+            if not pet:
                 yield "Sorry, we don't have any pets at the moment, perhaps it's time to restock?"
                 return
         else:
-            pet = get_one_by_type(pet_type, self.pet_directory.available())
+            pet = self.pet_directory.available_of_type(pet_type)
 
         if not pet:
-            try:
-                alternative = random.choice(list(self.pet_directory.available())).name
-            except IndexError:
+            alternative = self.pet_directory.random_available()
+            if not alternative:
                 yield "Sorry, we don't have any pets at the moment, perhaps it's time to restock?"
                 return
 
-            yield f"Sorry, we don't have {a_an(pet_type)} at the moment, perhaps you'd like {a_an(alternative)} instead?"
+            yield f"Sorry, we don't have {a_an(pet_type)} at the moment, perhaps you'd like {a_an(alternative.name)} instead?"
             return
 
+        self.changed(pet.id)
         self.pet_directory.set_owner(pet, adopter)
 
         yield ("send_message", adopter, NOISES.get(pet.emoji, "💖"), pet)
@@ -165,10 +179,12 @@ class AgencySync:
         if not pet:
             if not owned_pets:
                 return "Sorry, you don't have any pets to abandon, perhaps you'd like to adopt one?"
-            suggested_alternative = random.choice(owned_pets).type
+            suggested_alternative = random.choice(list(owned_pets)).type
             return f"Sorry, you don't have {a_an(pet_type)}. Would you like to abandon your {suggested_alternative} instead?"
 
+        self.changed(pet.id)
         self.pet_directory.remove(pet)
+        self.lured.remove(pet)
 
         return [
             ("send_message", adopter, sad_message(pet_type), pet),
@@ -185,8 +201,8 @@ class AgencySync:
         # For the moment this command needs to be addressed to the genie (maybe won't later).
         # Find any pets next to the speaker of the right type.
         #  Do we have any pets of the right type next to the speaker?
-        for pet in self.pet_directory.all_owned():
-            if is_adjacent(petter["pos"], pet.pos) and pet.type == pet_type:
+        for pet in list(self.pet_directory.near(petter["pos"])):
+            if pet.owner and pet.type == pet_type:
                 self.lured.add(pet, petter)
 
         return []
@@ -199,19 +215,22 @@ class AgencySync:
             if not owned_pets:
                 return "Sorry, you don't have any pets to give away, perhaps you'd like to adopt one?"
 
-            suggested_alternative = random.choice(owned_pets).type
+            suggested_alternative = random.choice(list(owned_pets)).type
 
             return f"Sorry, you don't have {a_an(pet_type)}. Would you like to give your {suggested_alternative} instead?"
 
         if not mentioned_entities:
             return f"Who to you want to give your {pet_type} to?"
-        recipient = self.avatars.get(mentioned_entities[0])
+        avatar = self.avatars.get(mentioned_entities[0])
 
-        if not recipient:
+        if not avatar:
             return "Sorry, I don't know who that is! (Are they online?)"
 
+        recipient = avatar.entity()
+
+        self.changed(pet.id)
         self.pet_directory.set_owner(pet, recipient)
-        position = offset_position(recipient["pos"], random.choice(DELTAS))
+        position = self.free_spot_near(recipient["pos"])
 
         return [
             ("send_message", recipient, NOISES.get(pet.emoji, "💖"), pet),
@@ -229,6 +248,7 @@ class AgencySync:
         if pet_type in ("all", "pets"):
             events = []
             for pet in pets_not_in_day_care:
+                self.changed(pet.id)
                 pet.is_in_day_care_center = True
                 position = DAY_CARE_CENTER.random_point()
                 events.append(
@@ -248,6 +268,7 @@ class AgencySync:
             return f"Sorry, you don't have {a_an(pet_type)}. Would you like to drop off your {suggested_alternative} instead?"
 
         position = DAY_CARE_CENTER.random_point()
+        self.changed(pet.id)
         pet.is_in_day_care_center = True
 
         return [
@@ -266,6 +287,7 @@ class AgencySync:
         if pet_type in ("all", "pets"):
             events = []
             for pet in pets_in_day_care:
+                self.changed(pet.id)
                 pet.is_in_day_care_center = False
                 events.append(("send_message", owner, NOISES.get(pet.emoji, "💖"), pet))
             if not events:
@@ -280,24 +302,45 @@ class AgencySync:
             suggested_alternative = random.choice(pets_in_day_care).type
             return f"Sorry, you don't have {a_an(pet_type)} to collect. Would you like to collect your {suggested_alternative} instead?"
 
+        self.changed(pet.id)
         pet.is_in_day_care_center = False
 
         return [
             ("send_message", owner, NOISES.get(pet.emoji, "💖"), pet),
         ]
 
+    def free_spot_near(self, pos, taken=()):
+        """A random square next to pos, preferring ones nobody is standing on."""
+        deltas = random.sample(DELTAS, len(DELTAS))
+        for delta in deltas:
+            spot = offset_position(pos, delta)
+            if (
+                position_tuple(spot) not in taken
+                and not self.pet_directory.occupied(spot)
+                and not self.avatar_positions.occupied(spot)
+            ):
+                return spot
+        return offset_position(pos, deltas[0])
+
     def handle_avatar(self, entity):
-        self.avatars[entity["id"]] = entity
+        self.avatar_positions.move(entity["id"], entity["pos"])
+        self.avatars.update(entity)
+
+        taken = set()
+
+        def place():
+            spot = self.free_spot_near(entity["pos"], taken)
+            taken.add(position_tuple(spot))
+            return spot
 
         for pet in self.lured.get_by_petter(entity["id"]):
-            position = offset_position(entity["pos"], random.choice(DELTAS))
-            yield ("update_pet", pet, position)
+            yield ("update_pet", pet, place())
 
         for pet in self.pet_directory.owned(entity["id"]):
             if pet.is_in_day_care_center or self.lured.check(pet):
                 pet_update = {}
             else:
-                pet_update = offset_position(entity["pos"], random.choice(DELTAS))
+                pet_update = place()
 
             # Handle possible name change.
             pet_name = owned_pet_name(entity, pet.type)
@@ -308,19 +351,38 @@ class AgencySync:
                 yield ("update_pet", pet, pet_update)
 
     def handle_restock(self, restocker):
+        # Pets created by a restock only reach the directory once the REST
+        # call returns, so a second restock straight after would see the
+        # same empty spaces and fill them again.
+        now = time.monotonic()
+        if (
+            self.restocked_at is not None
+            and now - self.restocked_at < RESTOCK_WINDOW_SECONDS
+        ):
+            yield "I've only just restocked, the new pets are on their way!"
+            return
+        self.restocked_at = now
+
         if self.pet_directory.empty_spawn_points():
             pet = min(
                 self.pet_directory.available(), key=lambda pet: pet.id, default=None
             )
             if pet:
+                self.changed(pet.id)
                 self.pet_directory.remove(pet)
                 yield ("delete_pet", pet)
                 yield f"{upfirst(a_an(pet.type))} was unwanted and has been sent to the farm."
 
+        # Pick distinct species that aren't already in stock, falling back to
+        # repeats if there are more empty spaces than unstocked species.
+        stocked = self.pet_directory.available_emojis()
+        species = list(
+            {pet["emoji"]: pet for pet in PETS if pet["emoji"] not in stocked}.values()
+        )
+        random.shuffle(species)
+
         for pos in self.pet_directory.empty_spawn_points():
-            pet = random.choice(PETS)
-            while any(x.emoji == pet["emoji"] for x in self.pet_directory.available()):
-                pet = random.choice(PETS)
+            pet = species.pop() if species else random.choice(PETS)
 
             pet = {
                 "name": pet["name"],
@@ -332,7 +394,73 @@ class AgencySync:
             yield ("create_pet", pet)
         yield "New pets now in stock!"
 
+    @contextlib.contextmanager
+    def fetching(self):
+        """Note the ids of pets created, removed or changed while a listing
+        is being fetched.
+
+        The listing may be older than what we already know about them.
+        """
+        changed = set()
+        self.fetches.append(changed)
+        try:
+            yield changed
+        finally:
+            self.fetches.remove(changed)
+
+    def changed(self, pet_id):
+        for changed in self.fetches:
+            changed.add(pet_id)
+
+    def reconcile(self, bots, changed_since_fetch=()):
+        """Bring the directory into line with a fresh listing of every bot.
+
+        Only pets that are new, gone or changed are touched. Pets in
+        changed_since_fetch are left as they are.
+        """
+        seen = set(changed_since_fetch)
+        for bot_json in bots:
+            if bot_json["id"] in seen:
+                continue
+            seen.add(bot_json["id"])
+
+            if self.genie and bot_json["id"] == self.genie.id:
+                continue
+
+            pet = self.pet_directory.get(bot_json["id"])
+            if pet is None:
+                self.handle_created(bot_json)
+                continue
+
+            fresh = Pet(bot_json)
+            # Available pets are indexed by position, so moving one means
+            # re-adding it.
+            if (pet.owner, pet.is_in_day_care_center, pet.name, pet.emoji) != (
+                fresh.owner,
+                fresh.is_in_day_care_center,
+                fresh.name,
+                fresh.emoji,
+            ) or (not pet.owner and pet.pos != fresh.pos):
+                self.pet_directory.remove(pet)
+                pet.refresh(bot_json)
+                self.pet_directory.add(pet)
+            elif pet.pos != fresh.pos:
+                self.pet_directory.move(pet, fresh.pos)
+
+        if self.genie and self.genie.id not in seen:
+            self.genie = None
+
+        for pet_id in list(self.pet_directory.ids()):
+            if pet_id not in seen:
+                pet = self.pet_directory[pet_id]
+                self.pet_directory.remove(pet)
+                self.lured.remove(pet)
+                yield ("forget_pet", pet)
+
+        yield from self.restore_fixtures()
+
     def handle_created(self, pet_json):
+        self.changed(pet_json["id"])
         pet = Pet(pet_json)
         if pet.emoji == GENIE_EMOJI:
             print("Found the genie: ", pet_json)
@@ -346,8 +474,9 @@ class AgencySync:
         except KeyError:
             pass
         else:
-            pet.pos = entity["pos"]
-            pet.bot_json["name"] = entity["name"]
+            self.changed(pet.id)
+            self.pet_directory.move(pet, entity["pos"])
+            self.pet_directory.rename(pet, entity["name"])
 
     def handle_command(self, adopter, text, mentioned_entities):
         parsed = parse_command(text)
@@ -371,10 +500,18 @@ class AgencySync:
         return handler(adopter, *groups)
 
     def handle_mention(self, adopter, message, mentioned_entity_ids):
-        if self.genie.id not in mentioned_entity_ids:
+        # A warm start can be running from a snapshot taken before the genie
+        # was created.
+        if not self.genie or self.genie.id not in mentioned_entity_ids:
             return
 
-        events = self.handle_command(adopter, message["text"], mentioned_entity_ids)
+        budget = self.command_budget.check(adopter["id"])
+        if budget == ALLOW:
+            events = self.handle_command(adopter, message["text"], mentioned_entity_ids)
+        elif budget == WARN:
+            events = "Slow down! Even a genie needs a moment between wishes."
+        else:
+            return
 
         if isinstance(events, str):
             events = [events]
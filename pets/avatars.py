@@ -0,0 +1,79 @@
+"""Bounded cache of the avatars we've seen recently."""
+
+import collections
+import time
+
+AVATAR_TTL_SECONDS = 3600
+MAX_AVATARS = 10000
+
+
+class Avatar:
+    __slots__ = ("id", "person_name", "x", "y", "seen_at")
+
+    def __init__(self, avatar_id, person_name, x, y, seen_at):
+        self.id = avatar_id
+        self.person_name = person_name
+        self.x = x
+        self.y = y
+        self.seen_at = seen_at
+
+    @property
+    def pos(self):
+        return {"x": self.x, "y": self.y}
+
+    def entity(self):
+        """The fields of the websocket entity that the game logic uses."""
+        return {"id": self.id, "person_name": self.person_name, "pos": self.pos}
+
+
+class AvatarCache:
+    """Avatars by id, dropping the least recently seen once the cache is full
+    or they haven't been seen for AVATAR_TTL_SECONDS."""
+
+    def __init__(self, max_size=None, ttl=None, on_evict=None):
+        self.max_size = max_size or MAX_AVATARS
+        self.ttl = ttl or AVATAR_TTL_SECONDS
+        self.on_evict = on_evict
+        self._avatars = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._avatars)
+
+    def __contains__(self, avatar_id):
+        return avatar_id in self._avatars
+
+    def update(self, entity):
+        now = time.monotonic()
+        avatar = self._avatars.get(entity["id"])
+        pos = entity["pos"]
+
+        if avatar is None:
+            self._avatars[entity["id"]] = Avatar(
+                entity["id"], entity["person_name"], pos["x"], pos["y"], now
+            )
+        else:
+            avatar.person_name = entity["person_name"]
+            avatar.x = pos["x"]
+            avatar.y = pos["y"]
+            avatar.seen_at = now
+            self._avatars.move_to_end(entity["id"])
+
+        self.evict(now)
+
+    def get(self, avatar_id):
+        avatar = self._avatars.get(avatar_id)
+        if avatar is None or avatar.seen_at < time.monotonic() - self.ttl:
+            return None
+        return avatar
+
+    def evict(self, now=None):
+        now = time.monotonic() if now is None else now
+        oldest_allowed = now - self.ttl
+
+        while self._avatars:
+            avatar_id, avatar = next(iter(self._avatars.items()))
+            if len(self._avatars) <= self.max_size and avatar.seen_at >= oldest_allowed:
+                break
+            del self._avatars[avatar_id]
+            if self.on_evict:
+                self.on_evict(avatar_id)
@@ -0,0 +1,152 @@
+"""Circuit breakers that stop us hammering a struggling RC Together API."""
+
+import asyncio
+import collections
+import time
+
+import rctogether
+
+from .transport import SessionWrapper
+
+# Open once at least FAILURE_RATE of the last WINDOW_SECONDS of requests have
+# failed, counting only once there have been MIN_REQUESTS.
+FAILURE_RATE = 0.5
+MIN_REQUESTS = 10
+WINDOW_SECONDS = 30.0
+# How long to stay open before letting a probe request through.
+OPEN_SECONDS = 10.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+BOT_ENDPOINTS = {"patch": "bots update", "post": "bots create", "delete": "bots delete"}
+
+
+class CircuitOpen(rctogether.api.HttpError):
+    """A request was refused without being sent, because its circuit is open."""
+
+    def __init__(self, breaker):
+        super().__init__(None, f"{breaker.name} circuit is {breaker.state}")
+        self.breaker = breaker
+
+
+class CircuitBreaker:
+    """Tracks the outcome of recent requests to one endpoint.
+
+    Closed, requests go through. When too many fail it opens and refuses
+    requests with CircuitOpen. After OPEN_SECONDS it is half-open, and lets a
+    single probe through: if that succeeds it closes again, otherwise it
+    reopens.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.outcomes = collections.deque()
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def _prune(self, now):
+        while self.outcomes and self.outcomes[0][0] < now - WINDOW_SECONDS:
+            _, failed = self.outcomes.popleft()
+            self.failures -= failed
+
+    def retry_after(self, now=None):
+        """Seconds until a probe will be let through, if the circuit is open."""
+        if self.state != OPEN:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.opened_at + OPEN_SECONDS - now)
+
+    def before_request(self):
+        if self.state == CLOSED:
+            return
+
+        if self.state == OPEN and self.retry_after() == 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return
+        raise CircuitOpen(self)
+
+    def cancelled(self):
+        """A request was cancelled before we learnt how it went."""
+        self.probing = False
+
+    def record(self, failed):
+        now = time.monotonic()
+
+        if self.state == HALF_OPEN and self.probing:
+            self.probing = False
+            if failed:
+                self._open(now)
+            else:
+                print(f"{self.name} circuit closed")
+                self.state = CLOSED
+                self.outcomes.clear()
+                self.failures = 0
+            return
+
+        self.outcomes.append((now, failed))
+        self.failures += failed
+        self._prune(now)
+        if (
+            self.state == CLOSED
+            and len(self.outcomes) >= MIN_REQUESTS
+            and self.failures >= FAILURE_RATE * len(self.outcomes)
+        ):
+            self._open(now)
+
+    def _open(self, now):
+        print(f"{self.name} circuit open after {self.failures} failures")
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+
+
+def endpoint(method, resource):
+    """The breaker a request counts towards, or None for reads."""
+    if method == "get":
+        return None
+    if resource == "bots":
+        return BOT_ENDPOINTS.get(method, f"bots {method}")
+    return resource
+
+
+class BreakerSession(SessionWrapper):
+    """Wraps a session with one CircuitBreaker per endpoint, so that a failing
+    endpoint (say, moving bots) doesn't stop another (genie replies).
+
+    is_failure(exc) decides which exceptions count against a breaker.
+    """
+
+    def __init__(self, session, is_failure):
+        super().__init__(session)
+        self.is_failure = is_failure
+        self.breakers = {}
+
+    def breaker(self, name):
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    async def _request(self, method, resource, *args, **kwargs):
+        name = endpoint(method, resource)
+        if name is None:
+            return await super()._request(method, resource, *args, **kwargs)
+
+        breaker = self.breaker(name)
+        breaker.before_request()
+        try:
+            result = await super()._request(method, resource, *args, **kwargs)
+        except asyncio.CancelledError:
+            breaker.cancelled()
+            raise
+        except Exception as exc:
+            breaker.record(self.is_failure(exc))
+            raise
+        breaker.record(False)
+        return result
@@ -0,0 +1,84 @@
+"""Budgets that stop one person, or everyone at once, flooding the genie."""
+
+import time
+
+# Each person may make USER_BURST commands at once, then one every
+# 1 / USER_RATE seconds.
+USER_RATE = 0.2
+USER_BURST = 5
+# Commands per second from everyone put together.
+GLOBAL_RATE = 5.0
+GLOBAL_BURST = 20
+# How often to forget people whose budget has refilled.
+PRUNE_SECONDS = 60.0
+
+ALLOW = "allow"
+WARN = "warn"
+IGNORE = "ignore"
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+
+class CommandBudget:
+    """Per-person and global token buckets in front of the genie's commands.
+
+    check() says whether to run a command. The first command refused from a
+    person gets a WARN, so they can be told to slow down; after that they are
+    ignored until they have budget again. Refusals for the global budget are
+    always ignored: replying would only add to the load.
+    """
+
+    def __init__(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.everyone = TokenBucket(GLOBAL_RATE, GLOBAL_BURST, now)
+        self.users = {}
+        self.warned = set()
+        self.refused = 0
+        self.pruned_at = now
+
+    def __len__(self):
+        return len(self.users)
+
+    def check(self, user_id, now=None):
+        now = time.monotonic() if now is None else now
+        self.prune(now)
+
+        bucket = self.users.get(user_id)
+        if bucket is None:
+            bucket = self.users[user_id] = TokenBucket(USER_RATE, USER_BURST, now)
+
+        if bucket.refill(now) < 1:
+            self.refused += 1
+            if user_id in self.warned:
+                return IGNORE
+            self.warned.add(user_id)
+            return WARN
+
+        if self.everyone.refill(now) < 1:
+            self.refused += 1
+            return IGNORE
+
+        bucket.tokens -= 1
+        self.everyone.tokens -= 1
+        self.warned.discard(user_id)
+        return ALLOW
+
+    def prune(self, now):
+        if now - self.pruned_at < PRUNE_SECONDS:
+            return
+        self.pruned_at = now
+        for user_id, bucket in list(self.users.items()):
+            if bucket.refill(now) >= bucket.burst:
+                del self.users[user_id]
+                self.warned.discard(user_id)
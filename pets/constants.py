@@ -4,7 +4,6 @@ import os
 import textwrap
 from .geometry import parse_position, position_tuple, offset_position, Region
 
-
 MANNERS = [
     "please",
     "bitte",
@@ -81,6 +80,20 @@ GENIE_NAME = os.environ.get("GENIE_NAME", "Pet Agency Genie")
 GENIE_EMOJI = "🧞"
 GENIE_HOME = parse_position(os.environ.get("GENIE_HOME", "60,15"))
 
+# Optional path to a local copy of the bot listing, used to warm start.
+SNAPSHOT_PATH = os.environ.get("PETS_SNAPSHOT")
+
+# Optional file name prefix to record every received entity to, for replaying.
+RECORDING_PATH = os.environ.get("PETS_RECORDING")
+
+# Optional local port to serve Prometheus metrics on.
+METRICS_PORT = int(os.environ.get("PETS_METRICS_PORT", "0")) or None
+
+# Optional file to write a Chrome trace of a sample of entities to.
+TRACE_PATH = os.environ.get("PETS_TRACE")
+# The fraction of entities to trace.
+TRACE_SAMPLE_RATE = float(os.environ.get("PETS_TRACE_SAMPLE_RATE", "0.01"))
+
 SPAWN_POINTS = {
     position_tuple(offset_position(GENIE_HOME, {"x": dx, "y": dy}))
     for (dx, dy) in [
@@ -107,6 +120,9 @@ DAY_CARE_CENTER = Region({"x": 0, "y": 62}, {"x": 11, "y": 74})
 
 PET_BOREDOM_TIMES = (3600, 5400)
 
+# Restock requests this soon after a restock are folded into it.
+RESTOCK_WINDOW_SECONDS = 30
+
 
 HELP_TEXT = textwrap.dedent(
     """\
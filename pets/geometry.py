@@ -42,3 +42,85 @@ class Region:
 
 
 DELTAS = [{"x": x, "y": y} for x in [-1, 0, 1] for y in [-1, 0, 1] if x != 0 or y != 0]
+
+
+GRID_CELL_SIZE = 8
+
+
+class SpatialGrid:
+    """Uniform-grid spatial hash of things with positions.
+
+    Lookups only visit the cells that overlap the area asked about, so they
+    cost O(things nearby) rather than O(everything).
+    """
+
+    def __init__(self, cell_size=None):
+        self.cell_size = cell_size or GRID_CELL_SIZE
+        self.cells = {}
+        self.positions = {}
+        self.occupancy = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _cell(self, x, y):
+        return (x // self.cell_size, y // self.cell_size)
+
+    def move(self, key, pos, value=None):
+        """Add key at pos, or move it there if it's already in the grid."""
+        point = position_tuple(pos)
+        if self.positions.get(key) == point:
+            self.cells[self._cell(*point)][key] = value
+            return
+
+        self.remove(key)
+        self.positions[key] = point
+        self.cells.setdefault(self._cell(*point), {})[key] = value
+        self.occupancy[point] = self.occupancy.get(point, 0) + 1
+
+    def remove(self, key):
+        point = self.positions.pop(key, None)
+        if point is None:
+            return
+
+        cell_key = self._cell(*point)
+        cell = self.cells[cell_key]
+        del cell[key]
+        if not cell:
+            del self.cells[cell_key]
+
+        count = self.occupancy[point] - 1
+        if count:
+            self.occupancy[point] = count
+        else:
+            del self.occupancy[point]
+
+    def occupied(self, pos):
+        return position_tuple(pos) in self.occupancy
+
+    def _within(self, x0, y0, x1, y1):
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for key, value in self.cells.get((cx, cy), {}).items():
+                    x, y = self.positions[key]
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        yield value
+
+    def near(self, pos, radius=1):
+        """Values within `radius` squares of pos, diagonals included."""
+        return self._within(
+            pos["x"] - radius, pos["y"] - radius, pos["x"] + radius, pos["y"] + radius
+        )
+
+    def in_region(self, region):
+        return self._within(
+            region.top_left["x"],
+            region.top_left["y"],
+            region.bottom_right["x"],
+            region.bottom_right["y"],
+        )
@@ -0,0 +1,34 @@
+"""Multi-phrase matching for politeness and other keywords."""
+
+import re
+
+from .constants import MANNERS
+
+
+def trie_pattern(phrases):
+    """A regex for any of phrases, factored into a trie so that the regex
+    engine follows one branch per character rather than trying each phrase
+    in turn."""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [
+            re.escape(char) + build(child) for char, child in node.items() if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+# Finds any of MANNERS in a lower cased message, as `please in text.lower()`
+# would for each of them. Lower casing first is several times faster than
+# searching with re.IGNORECASE.
+MANNERS_MATCHER = re.compile(trie_pattern(manner.lower() for manner in MANNERS))
@@ -1,35 +1,69 @@
 """Lure tracking for pets."""
 
+import heapq
 import time
-from collections import defaultdict
-
 
 LURE_TIME_SECONDS = 600
 
 
 class Lured:
+    """Which pets have been lured away from their owners, and by whom.
+
+    Expiry times are kept in a min-heap so that expired lures can be purged in
+    bulk. Re-luring a pet leaves its old heap entry behind; stale entries are
+    skipped when they reach the top, and the heap is rebuilt if they ever
+    outnumber the live lures.
+    """
+
     def __init__(self):
         self.pets = {}
-        self.by_petter = defaultdict(list)
+        self.petter_of = {}
+        self.by_petter = {}
+        self.expiries = []
+
+    def __len__(self):
+        return len(self.pets)
 
     def add(self, pet, petter):
         # Use module-level variable to allow tests to modify the value
-        self.pets[pet.id] = time.time() + LURE_TIME_SECONDS
-        self.by_petter[petter["id"]].append(pet)
+        expires_at = time.time() + LURE_TIME_SECONDS
 
-    def check(self, pet):
-        if pet.id not in self.pets:
-            return False
+        self._remove(pet.id)
+        self.pets[pet.id] = expires_at
+        self.petter_of[pet.id] = petter["id"]
+        self.by_petter.setdefault(petter["id"], {})[pet.id] = pet
+        heapq.heappush(self.expiries, (expires_at, pet.id))
+
+        if len(self.expiries) > 2 * len(self.pets) + 16:
+            self.expiries = [(expiry, pet_id) for pet_id, expiry in self.pets.items()]
+            heapq.heapify(self.expiries)
 
-        if self.pets[pet.id] < time.time():  # if timer is expired
-            del self.pets[pet.id]
-            for petter_id in self.by_petter:
-                for lured_pet in self.by_petter[petter_id]:
-                    if lured_pet.id == pet.id:
-                        self.by_petter[petter_id].remove(lured_pet)
-            return False
+    def _remove(self, pet_id):
+        if self.pets.pop(pet_id, None) is None:
+            return
 
-        return True
+        petter_id = self.petter_of.pop(pet_id)
+        lured_pets = self.by_petter[petter_id]
+        del lured_pets[pet_id]
+        if not lured_pets:
+            del self.by_petter[petter_id]
+
+    def purge(self, now=None):
+        now = time.time() if now is None else now
+
+        while self.expiries and self.expiries[0][0] < now:
+            expires_at, pet_id = heapq.heappop(self.expiries)
+            if self.pets.get(pet_id) == expires_at:
+                self._remove(pet_id)
+
+    def check(self, pet):
+        self.purge()
+        return pet.id in self.pets
 
     def get_by_petter(self, petter_id):
-        return self.by_petter.get(petter_id, [])
+        self.purge()
+        lured_pets = self.by_petter.get(petter_id)
+        return list(lured_pets.values()) if lured_pets else []
+
+    def remove(self, pet):
+        self._remove(pet.id)
@@ -0,0 +1,359 @@
+"""Prometheus metrics for the agency, served over plain asyncio.
+
+Only the text exposition format is implemented, which is all a scraper
+needs. Enable it by setting PETS_METRICS_PORT.
+"""
+
+import asyncio
+import bisect
+import time
+
+import rctogether
+
+from .transport import RequestTimeout, SessionWrapper
+
+METRICS_HOST = "127.0.0.1"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.5
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in self.values.items():
+            yield self.name, dict(zip(self.labelnames, labelvalues)), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets or LATENCY_BUCKETS)
+        self.values = {}
+
+    def observe(self, value, *labelvalues):
+        counts = self.values.get(labelvalues)
+        if counts is None:
+            # One count per bucket plus +Inf, then the sum.
+            counts = self.values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for labelvalues, counts in self.values.items():
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {
+                    **labels,
+                    "le": format_value(bound),
+                }, cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, counts[-1]
+
+
+class Callback:
+    """A metric read from fn() at scrape time.
+
+    fn returns a number, or a dict mapping label value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, fn, kind="gauge", labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.kind = kind
+        self.labelnames = labelnames
+
+    def samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labelvalues, value in values.items():
+            yield self.name, dict(zip(self.labelnames, labelvalues)), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, fn, kind="gauge", labelnames=()):
+        return self.register(Callback(name, documentation, fn, kind, labelnames))
+
+    def on_collect(self, fn):
+        """Call fn() at the start of every render, say to take a snapshot
+        that several callbacks read."""
+        self.collectors.append(fn)
+
+    def render(self):
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception as exc:
+                print(f"Metrics collection failed: {exc!r}")
+
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as exc:
+                print(f"Metric {metric.name} failed: {exc!r}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REST_REQUESTS = REGISTRY.counter(
+    "pets_rest_requests_total", "REST calls made to RC Together.", ("verb",)
+)
+REST_LATENCY = REGISTRY.histogram(
+    "pets_rest_latency_seconds", "Time taken by REST calls.", ("verb",)
+)
+HTTP_ERRORS = REGISTRY.counter(
+    "pets_http_errors_total", "REST calls that failed, by HTTP status.", ("status",)
+)
+LOOP_LAG = REGISTRY.histogram(
+    "pets_event_loop_lag_seconds", "How late the event loop woke a sleeping task."
+)
+
+
+def error_status(exc):
+    if isinstance(exc, RequestTimeout):
+        return "timeout"
+    if exc.args and exc.args[0] is not None:
+        return exc.args[0]
+    return "unknown"
+
+
+class MeteredSession(SessionWrapper):
+    """Wraps a RestApiSession, counting and timing every request by verb."""
+
+    async def _request(self, verb, *args, **kwargs):
+        REST_REQUESTS.inc(verb)
+        started = time.monotonic()
+        try:
+            return await super()._request(verb, *args, **kwargs)
+        except rctogether.api.HttpError as exc:
+            HTTP_ERRORS.inc(error_status(exc))
+            raise
+        finally:
+            REST_LATENCY.observe(time.monotonic() - started, verb)
+
+
+def watch_agency(agency, registry=REGISTRY):
+    # agency.stats() is read once per scrape, not once per metric.
+    snapshot = {}
+
+    def collect():
+        snapshot.clear()
+        snapshot.update(agency.stats())
+
+    registry.on_collect(collect)
+
+    def stat(*keys):
+        def read():
+            value = snapshot
+            for key in keys:
+                value = value[key]
+            return value
+
+        return read
+
+    def by_label(*keys):
+        read = stat(*keys)
+        return lambda: {(label,): value for label, value in read().items()}
+
+    registry.callback(
+        "pets_entities_received_total",
+        "Websocket entities received, by type.",
+        by_label("entities_received"),
+        kind="counter",
+        labelnames=("type",),
+    )
+    for key, documentation in [
+        ("intake_depth", "Entities waiting for the game logic."),
+        ("dispatch_depth", "Events waiting to be dispatched."),
+        ("active_lanes", "Per-avatar dispatch tasks running."),
+        (
+            "max_lag",
+            "Longest wait from receiving an entity to dispatching its event, "
+            "since the last scrape.",
+        ),
+        ("boredom_timers", "Pets with a boredom timer set."),
+        ("pets", "Pets the agency knows about."),
+        ("avatars", "Avatars seen recently."),
+        ("lured_pets", "Pets currently lured away from their owners."),
+    ]:
+        registry.callback(f"pets_{key}", documentation, stat(key))
+    registry.callback(
+        "pets_commands_refused_total",
+        "Genie commands refused for going over a command budget.",
+        stat("commands_refused"),
+        kind="counter",
+    )
+    for key, documentation in [
+        ("pending", "Pets with a merged update waiting to be sent."),
+        ("active", "Pets with an update pending, in flight or cooling down."),
+        ("ready", "Pets waiting for a free update worker."),
+        ("sending", "Update workers busy sending."),
+        ("parked", "Pets with updates held back by an open circuit."),
+    ]:
+        registry.callback(
+            f"pets_update_queues_{key}", documentation, stat("update_queues", key)
+        )
+    registry.callback(
+        "pets_update_queues_dropped_total",
+        "Wanders dropped because the update queues were backed up.",
+        stat("update_queues", "dropped"),
+        kind="counter",
+    )
+    registry.callback(
+        "pets_update_queues_pending_by_lane",
+        "Pets with a merged update waiting to be sent, by priority lane.",
+        by_label("update_queues", "pending_by_lane"),
+        labelnames=("lane",),
+    )
+
+
+def watch_rate_limiter(limiter, registry=REGISTRY):
+    registry.callback(
+        "pets_rate_limit", "Current REST rate limit per second.", lambda: limiter.rate
+    )
+    registry.callback(
+        "pets_rate_limit_waiting",
+        "REST calls waiting for the rate limiter.",
+        lambda: limiter.waiting,
+    )
+    registry.callback(
+        "pets_rate_limit_waiting_by_lane",
+        "REST calls waiting for the rate limiter, by priority lane.",
+        lambda: {
+            (lane,): waiting
+            for lane, waiting in limiter.stats()["waiting_by_lane"].items()
+        },
+        labelnames=("lane",),
+    )
+
+
+def watch_breakers(breakers, registry=REGISTRY):
+    """breakers maps endpoint names to circuit_breaker.CircuitBreakers."""
+    registry.callback(
+        "pets_circuit_open",
+        "Whether requests to an endpoint are being refused (half-open is 0.5).",
+        lambda: {
+            (name,): {"closed": 0, "half-open": 0.5, "open": 1}[breaker.state]
+            for name, breaker in breakers.items()
+        },
+        labelnames=("endpoint",),
+    )
+    registry.callback(
+        "pets_circuit_opened_total",
+        "Times each endpoint's circuit has opened.",
+        lambda: {(name,): breaker.times_opened for name, breaker in breakers.items()},
+        kind="counter",
+        labelnames=("endpoint",),
+    )
+
+
+async def monitor_loop_lag(interval=None):
+    interval = interval or LOOP_LAG_INTERVAL
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.monotonic() - started - interval))
+
+
+async def handle_request(reader, writer, registry, handlers):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        path, _, query = parts[1].partition("?") if len(parts) >= 2 else ("", "", "")
+        if parts and parts[0] != "GET":
+            status, body = "405 Method Not Allowed", "Only GET is supported\n"
+        elif path == "/metrics":
+            status, body = "200 OK", registry.render()
+        elif path in handlers:
+            status, body = await handlers[path](query)
+        else:
+            status, body = "404 Not Found", "Not found\n"
+
+        body = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port, host=None, registry=REGISTRY, handlers=None):
+    """Serve /metrics on host:port until the server is closed.
+
+    handlers maps other paths to async functions that take the query string
+    and return an HTTP status line and a text body.
+    """
+    handlers = handlers or {}
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_request(reader, writer, registry, handlers),
+        host or METRICS_HOST,
+        port,
+    )
+    print(f"Serving metrics on http://{host or METRICS_HOST}:{port}/metrics")
+    return server
@@ -1,6 +1,14 @@
 import re
 from typing import Optional
 from .constants import MANNER_PREFIXES
+from .keywords import trie_pattern
+
+ADOPTION = r"(.*adopt (?:a|an|the|one)? ([A-Za-z'-]+)\s*([A-Za-z'-]*).*)"
+
+# The core of ADOPTION without the leading and trailing ".*". It matches exactly
+# when ADOPTION does, but without backtracking over the rest of each line from
+# every starting position, so it is a cheap check to make first.
+ADOPTION_GUARD = r"adopt (?:a|an|the|one)? [A-Za-z'-]"
 
 COMMANDS = {
     "time to restock": "restock",
@@ -15,38 +23,164 @@ COMMANDS = {
 }
 
 
-def parse_adoption(message: str) -> Optional[tuple]:
-    """Special parser for adoption commands that handles 'pet' ambiguity."""
-    pet_match = re.search(
-        r"(.*adopt (?:a|an|the|one)? ([A-Za-z'-]+)\s*([A-Za-z'-]*).*)",
-        message,
-        re.IGNORECASE,
-    )
+# Literal phrases, one of which occurs in any message a command's pattern
+# matches. Lower case.
+KEYWORDS = {
+    "adoption": ("adopt ",),
+    "restock": ("time to restock",),
+    "day_care_drop_off": ("look after my ", "take care of my ", "drop off my "),
+    "day_care_pick_up": ("collect my ", "pick up my ", "get my "),
+    "thanks": ("thank",),
+    "abandon": ("abandon my ",),
+    "social_rules": (
+        "well-actually",
+        "well actually",
+        "feigning surprise",
+        "backseat driving",
+        "subtle",
+    ),
+    "pet_a_pet": ("pet the ",),
+    "give_pet": ("give my ",),
+    "help": ("help",),
+}
 
-    if not pet_match:
+
+class Dispatcher:
+    """Finds the first command, in priority order, whose pattern matches.
+
+    One pass of a trie regex over the message, ignoring case, finds the
+    keywords in it, and so the commands that could match; only their
+    patterns are then tried, so most messages are scanned once and searched
+    by at most one pattern. The pass doesn't look for a keyword inside one it
+    has already found, so pairs of keywords that can overlap ("help" and "pet
+    the ") are also added as one longer keyword that counts for both.
+
+    guards optionally maps a command to a cheaper pattern that must also
+    match, which is tried first. A command's guard, or else its pattern,
+    must match starting at one of its keywords, so it is only searched for
+    from the first of them.
+    """
+
+    def __init__(self, commands, keywords, guards=None):
+        guards = guards or {}
+        self.commands = [
+            (
+                command,
+                re.compile(pattern, re.IGNORECASE),
+                (
+                    re.compile(guards[command], re.IGNORECASE)
+                    if command in guards
+                    else None
+                ),
+            )
+            for pattern, command in commands
+        ]
+        priority = {command: index for index, (_, command) in enumerate(commands)}
+
+        # Each keyword maps to the positions in self.commands of the
+        # commands it is for.
+        self.phrase_commands = {}
+        for command, phrases in keywords.items():
+            for phrase in phrases:
+                self.phrase_commands.setdefault(phrase, set()).add(priority[command])
+        for first, first_commands in list(self.phrase_commands.items()):
+            for second, second_commands in list(self.phrase_commands.items()):
+                if second in first and second != first:
+                    raise ValueError(f"Keyword {second!r} is inside {first!r}")
+                for length in range(1, min(len(first), len(second))):
+                    if first[-length:] == second[:length]:
+                        self.phrase_commands[first + second[length:]] = (
+                            first_commands | second_commands
+                        )
+        pattern = trie_pattern(self.phrase_commands)
+        self.keywords = re.compile(pattern)
+        # Case insensitive, like the commands' patterns, so that both agree on
+        # characters such as "ı" that only match "i" that way.
+        self.any_case_keywords = re.compile(pattern, re.IGNORECASE)
+
+    def commands_for(self, found):
+        """The positions in self.commands of a keyword found in any case."""
+        commands = self.phrase_commands.get(found.lower())
+        if commands is None:
+            # Some characters that match case insensitively, such as "ı" and
+            # "i", don't lower case to the same thing.
+            for phrase, commands in self.phrase_commands.items():
+                if re.fullmatch(re.escape(phrase), found, re.IGNORECASE):
+                    break
+        return commands
+
+    def match(self, message):
+        """The first command that matches, and its match object, or None."""
+        # Where the first keyword for each candidate command starts.
+        candidates = {}
+        if message.isascii():
+            # Lower casing ASCII keeps every position and agrees with
+            # re.IGNORECASE, and the case sensitive trie is several times
+            # faster to search.
+            lowered = message.lower()
+            for phrase in self.keywords.findall(lowered):
+                for index in self.phrase_commands[phrase]:
+                    if index not in candidates:
+                        candidates[index] = lowered.find(phrase)
+        else:
+            for found in self.any_case_keywords.finditer(message):
+                for index in self.commands_for(found.group()):
+                    candidates.setdefault(index, found.start())
+
+        for index in sorted(candidates):
+            command, pattern, guard = self.commands[index]
+            start = candidates[index]
+            if guard:
+                if not guard.search(message, start):
+                    continue
+                match = pattern.search(message)
+            else:
+                match = pattern.search(message, start)
+            if match:
+                return command, match
         return None
 
-    first_word = pet_match.group(2).lower() if pet_match.group(2) else ""
-    second_word = pet_match.group(3).lower() if pet_match.group(3) else ""
+
+ADOPTION_PATTERN = re.compile(ADOPTION, re.IGNORECASE)
+DISPATCHER = Dispatcher(
+    [(ADOPTION, "adoption"), *COMMANDS.items()],
+    KEYWORDS,
+    {"adoption": ADOPTION_GUARD},
+)
+
+
+def adoption_result(full_text, first_word, second_word):
+    first_word = first_word.lower() if first_word else ""
+    second_word = second_word.lower() if second_word else ""
 
     if first_word == "pet":
         if second_word and second_word not in MANNER_PREFIXES:
-            return (pet_match.group(0), second_word)
-        return (pet_match.group(0), "pet")
+            return (full_text, second_word)
+        return (full_text, "pet")
+
+    return (full_text, first_word)
+
+
+def parse_adoption(message: str) -> Optional[tuple]:
+    """Special parser for adoption commands that handles 'pet' ambiguity."""
+    pet_match = ADOPTION_PATTERN.search(message)
 
-    return (pet_match.group(0), first_word)
+    if not pet_match:
+        return None
+
+    return adoption_result(pet_match.group(0), pet_match.group(2), pet_match.group(3))
 
 
 def parse_command(message: str) -> Optional[tuple]:
+    dispatched = DISPATCHER.match(message)
+    if not dispatched:
+        return None
+
+    command, match = dispatched
+    groups = match.groups()
+
     # Special handling for adoption commands
-    adoption_match = parse_adoption(message)
-    if adoption_match:
-        full_text, animal_type = adoption_match
-        return ("adoption", (full_text, animal_type))
-
-    # Regular command parsing
-    for pattern, command in COMMANDS.items():
-        match = re.search(pattern, message, re.IGNORECASE)
-        if match:
-            return (command, match.groups())
-    return None
+    if command == "adoption":
+        return ("adoption", adoption_result(*groups))
+
+    return (command, groups)
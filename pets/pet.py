@@ -2,8 +2,29 @@
 
 
 class Pet:
+    """The parts of a bot that the agency cares about.
+
+    Only the fields we use are copied out of the bot json, and `type` is
+    worked out once whenever the name changes rather than on every access.
+    """
+
+    __slots__ = (
+        "id",
+        "emoji",
+        "pos",
+        "owner",
+        "is_in_day_care_center",
+        "_name",
+        "type",
+    )
+
     def __init__(self, bot_json, *a, **k):
-        self.bot_json = bot_json
+        self.refresh(bot_json)
+
+    def refresh(self, bot_json):
+        self.id = bot_json["id"]
+        self.name = bot_json["name"]
+        self.emoji = bot_json["emoji"]
         self.pos = bot_json["pos"]
         self.is_in_day_care_center = False
         message = bot_json.get("message")
@@ -15,20 +36,16 @@ class Pet:
             self.owner = None
 
     @property
-    def type(self):
-        return self.name.split(" ")[-1]
-
-    @property
-    def id(self):
-        return self.bot_json["id"]
+    def name(self):
+        return self._name
 
-    @property
-    def emoji(self):
-        return self.bot_json["emoji"]
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self.type = name.split(" ")[-1]
 
-    @property
-    def name(self):
-        return self.bot_json["name"]
+    def __repr__(self):
+        return f"<Pet {self.id!r} {self.emoji} {self.name!r}>"
 
 
 def owned_pet_name(owner, pet_type):
@@ -1,8 +1,7 @@
 """Pet registry and directory management."""
 
-from collections import defaultdict
-from .geometry import position_tuple
-
+import random
+from .geometry import position_tuple, SpatialGrid
 
 # Spawn points are defined in config, but we need to import them
 # This will be set after config is created
@@ -12,37 +11,121 @@ SPAWN_POINTS = None
 class PetDirectory:
     def __init__(self):
         self._available_pets = {}
+        # Secondary indexes over the available pets. The keys each pet was
+        # indexed under are remembered, so a pet can be removed even if its
+        # name or emoji has changed in the meantime.
+        self._available_keys = {}
+        self._available_by_type = {}
+        self._available_by_emoji = {}
+        self._available_sample = []
+        self._sample_index = {}
         self.mystery_pets = []
-        self._owned_pets = defaultdict(list)
+        # owner id -> {pet id: pet}; owners without pets have no entry.
+        self._owned_pets = {}
         self._pets_by_id = {}
+        self._grid = SpatialGrid()
 
     def add(self, pet):
         self._pets_by_id[pet.id] = pet
+        self._grid.move(pet.id, pet.pos, pet)
 
         if pet.owner:
-            self._owned_pets[pet.owner].append(pet)
+            self._owned_pets.setdefault(pet.owner, {})[pet.id] = pet
         elif pet.emoji == "🎁":
             self.mystery_pets.append(pet)
         else:
-            self._available_pets[position_tuple(pet.pos)] = pet
+            self._add_available(pet)
+
+    def _add_available(self, pet):
+        keys = (position_tuple(pet.pos), pet.type, pet.emoji)
+        self._available_keys[pet.id] = keys
+
+        self._available_pets[keys[0]] = pet
+        self._available_by_type.setdefault(keys[1], {})[pet.id] = pet
+        self._available_by_emoji.setdefault(keys[2], {})[pet.id] = pet
+
+        self._sample_index[pet.id] = len(self._available_sample)
+        self._available_sample.append(pet)
+
+    def _remove_available(self, pet):
+        keys = self._available_keys.pop(pet.id, None)
+        if keys is None:
+            return
+        pos_key, pet_type, emoji = keys
+
+        if self._available_pets.get(pos_key) is pet:
+            del self._available_pets[pos_key]
+
+        for index, key in (
+            (self._available_by_type, pet_type),
+            (self._available_by_emoji, emoji),
+        ):
+            pets = index[key]
+            del pets[pet.id]
+            if not pets:
+                del index[key]
+
+        # Swap the last pet into the removed pet's slot.
+        position = self._sample_index.pop(pet.id)
+        last = self._available_sample.pop()
+        if last is not pet:
+            self._available_sample[position] = last
+            self._sample_index[last.id] = position
 
     def remove(self, pet):
         del self._pets_by_id[pet.id]
+        self._grid.remove(pet.id)
 
         if pet.owner:
-            self._owned_pets[pet.owner].remove(pet)
+            owned_pets = self._owned_pets[pet.owner]
+            del owned_pets[pet.id]
+            if not owned_pets:
+                del self._owned_pets[pet.owner]
         elif pet in self.mystery_pets:
             # Mystery pet - remove from mystery_pets list
             self.mystery_pets.remove(pet)
         else:
-            # Available pet - remove from position-indexed dict
-            pos_key = position_tuple(pet.pos)
-            if pos_key in self._available_pets:
-                del self._available_pets[pos_key]
+            self._remove_available(pet)
+
+    def rename(self, pet, name):
+        if pet.name == name:
+            return
+
+        indexed = pet.id in self._available_keys
+        if indexed:
+            self._remove_available(pet)
+        pet.name = name
+        if indexed:
+            self._add_available(pet)
+
+    def move(self, pet, pos):
+        pet.pos = pos
+        if pet.id in self._grid:
+            self._grid.move(pet.id, pos, pet)
+
+    def near(self, pos, radius=1):
+        return self._grid.near(pos, radius)
+
+    def in_region(self, region):
+        return self._grid.in_region(region)
+
+    def occupied(self, pos):
+        return self._grid.occupied(pos)
 
     def available(self):
         return self._available_pets.values()
 
+    def random_available(self):
+        if not self._available_sample:
+            return None
+        return random.choice(self._available_sample)
+
+    def available_of_type(self, pet_type):
+        return next(iter(self._available_by_type.get(pet_type, {}).values()), None)
+
+    def available_emojis(self):
+        return self._available_by_emoji.keys()
+
     def empty_spawn_points(self):
         # Import at runtime to avoid circular dependency
         from .constants import SPAWN_POINTS
@@ -50,7 +133,11 @@ class PetDirectory:
         return SPAWN_POINTS - set(self._available_pets.keys())
 
     def owned(self, owner_id):
-        return self._owned_pets[owner_id]
+        owned_pets = self._owned_pets.get(owner_id)
+        return owned_pets.values() if owned_pets else ()
+
+    def owned_count(self, owner_id):
+        return len(self._owned_pets.get(owner_id, ()))
 
     def __iter__(self):
         for pet in self._available_pets.values():
@@ -60,8 +147,10 @@ class PetDirectory:
 
     def all_owned(self):
         for pet_collection in self._owned_pets.values():
-            for pet in pet_collection:
-                yield pet
+            yield from pet_collection.values()
+
+    def ids(self):
+        return self._pets_by_id.keys()
 
     def __getitem__(self, pet_id):
         return self._pets_by_id[pet_id]
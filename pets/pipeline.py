@@ -0,0 +1,118 @@
+"""Staged ingestion of websocket entities.
+
+Entities are buffered in a bounded intake queue, run through the synchronous
+game logic one at a time, and the resulting events are dispatched on
+per-avatar lanes so that a slow REST call for one avatar doesn't hold up
+anyone else.
+"""
+
+import asyncio
+import collections
+import time
+
+from . import tracing
+
+INTAKE_SIZE = 1000
+
+
+class IngestPipeline:
+    def __init__(self, process, dispatch, intake_size=None):
+        """
+        process(entity) -> [(lane_key, event), ...]   (synchronous game logic)
+        dispatch(event)                                (async REST I/O)
+        """
+        self.process = process
+        self.dispatch = dispatch
+        self.intake = asyncio.Queue(intake_size or INTAKE_SIZE)
+        self.lanes = {}
+        self.lane_tasks = {}
+        self.logic_task = None
+        self.pending_events = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _start(self):
+        if self.logic_task is None:
+            self.logic_task = asyncio.create_task(self._run_logic())
+
+    async def put(self, entity, trace=None):
+        """Queue an entity, optionally with the tracing.Trace it belongs to."""
+        self._start()
+        await self.intake.put((time.monotonic(), entity, trace))
+
+    async def _run_logic(self):
+        while True:
+            received_at, entity, trace = await self.intake.get()
+            started = time.monotonic()
+            try:
+                for lane_key, event in self.process(entity):
+                    self._enqueue(lane_key, received_at, event, trace)
+            except Exception as exc:
+                print(f"Failed to process entity: {entity!r}, {exc!r}")
+            finally:
+                self.intake.task_done()
+
+            if trace:
+                trace.add_span("intake wait", received_at, started)
+                trace.add_span("process", started, time.monotonic())
+
+    def _enqueue(self, lane_key, received_at, event, trace=None):
+        self.pending_events += 1
+        lane = self.lanes.get(lane_key)
+        if lane is None:
+            lane = self.lanes[lane_key] = collections.deque()
+            self.lane_tasks[lane_key] = asyncio.create_task(self._run_lane(lane_key))
+        lane.append((received_at, time.monotonic(), event, trace))
+
+    async def _run_lane(self, lane_key):
+        lane = self.lanes[lane_key]
+        try:
+            while lane:
+                received_at, queued_at, event, trace = lane.popleft()
+                started = time.monotonic()
+                self.last_lag = started - received_at
+                self.max_lag = max(self.max_lag, self.last_lag)
+                try:
+                    with tracing.activate(trace):
+                        await self.dispatch(event)
+                except Exception as exc:
+                    print(f"Failed to dispatch event: {event!r}, {exc!r}")
+                finally:
+                    self.pending_events -= 1
+
+                if trace:
+                    trace.add_span("dispatch wait", queued_at, started)
+                    trace.add_span(event[0], started, time.monotonic())
+        finally:
+            del self.lanes[lane_key]
+            del self.lane_tasks[lane_key]
+
+    def stats(self):
+        """Current queue depths and lags. max_lag is the longest lag since
+        the last call, so each metrics scrape sees its own interval."""
+        stats = {
+            "intake_depth": self.intake.qsize(),
+            "dispatch_depth": self.pending_events,
+            "active_lanes": len(self.lanes),
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+        }
+        self.max_lag = 0.0
+        return stats
+
+    async def join(self):
+        """Wait until everything received so far has been dispatched."""
+        await self.intake.join()
+        while self.lane_tasks:
+            await asyncio.gather(*self.lane_tasks.values())
+
+    async def close(self):
+        if self.logic_task is None:
+            return
+        await self.join()
+        self.logic_task.cancel()
+        try:
+            await self.logic_task
+        except asyncio.CancelledError:
+            pass
+        self.logic_task = None
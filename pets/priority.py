@@ -0,0 +1,45 @@
+"""Priority lanes for outbound work.
+
+Replies to people come first, then renames, then pets following their
+owners, then bored pets wandering off. The priority of the work in hand is
+kept in a contextvar, so the update queues and the rate limiter can see it
+without it being passed through every call.
+"""
+
+import contextlib
+import contextvars
+
+REPLY = 0
+RENAME = 1
+FOLLOW = 2
+WANDER = 3
+
+PRIORITIES = (REPLY, RENAME, FOLLOW, WANDER)
+NAMES = {REPLY: "reply", RENAME: "rename", FOLLOW: "follow", WANDER: "wander"}
+
+_current = contextvars.ContextVar("priority", default=REPLY)
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def use(priority):
+    token = _current.set(priority)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def of_event(event):
+    """The lane an agency event's REST calls belong in."""
+    match event[0]:
+        case "sync_update_pet":
+            return RENAME
+        case "update_pet":
+            update = event[2]
+            return FOLLOW if "x" in update or "y" in update else RENAME
+        case _:
+            return REPLY
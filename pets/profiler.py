@@ -0,0 +1,203 @@
+"""A sampling profiler that can be switched on in the running genie.
+
+A background thread samples the event loop thread's stack every
+PROFILE_INTERVAL seconds and writes the result as collapsed stacks, the
+input format of flamegraph.pl, speedscope and similar tools. Each stack is
+rooted at the part of the agency it is attributed to, so the flame graph
+groups samples by category.
+
+Only the running coroutine is on the stack, so a coroutine waiting for the
+server isn't. Instead, samples taken while the event loop is idle count as
+rctogether I/O if any REST requests are in flight, and as idle otherwise.
+"""
+
+import asyncio
+import collections
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+PROFILE_INTERVAL = 0.005
+PROFILE_SECONDS = 30
+MAX_PROFILE_SECONDS = 300
+PROFILE_DIR = os.environ.get("PETS_PROFILE_DIR", tempfile.gettempdir())
+
+
+def package_path(name):
+    return os.path.join("pets", name)
+
+
+def categorise(code):
+    """The category a frame counts towards, or None."""
+    filename = code.co_filename
+    if filename.endswith(package_path("agency_sync.py")) and code.co_name.startswith(
+        "handle_"
+    ):
+        return f"AgencySync.{code.co_name}"
+    if filename.endswith(package_path("parser.py")):
+        return "parse_command"
+    if filename.endswith(package_path("update_queues.py")):
+        return "UpdateQueues"
+    if (
+        f"{os.sep}rctogether{os.sep}" in filename
+        or f"{os.sep}aiohttp{os.sep}" in filename
+    ):
+        return "rctogether I/O"
+    if filename.endswith("selectors.py") and code.co_name == "select":
+        return "idle"
+    return None
+
+
+def category_of(stack, waiting_for_io):
+    # The innermost frame we recognise wins, so parse_command called from a
+    # handler counts as parsing.
+    for code in reversed(stack):
+        category = categorise(code)
+        if category:
+            if category == "idle" and waiting_for_io:
+                return "rctogether I/O"
+            return category
+    return "other"
+
+
+def describe(code):
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Sampler:
+    """Samples one thread's stack from a background thread.
+
+    Stacks are kept as tuples of code objects, outermost first, and only
+    turned into text when the profile is written, to keep each sample cheap.
+    in_flight() optionally returns how many REST requests are waiting for
+    the server.
+    """
+
+    def __init__(self, thread_id=None, interval=None, in_flight=None):
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.interval = interval or PROFILE_INTERVAL
+        self.in_flight = in_flight
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None):
+        self.stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(seconds or PROFILE_SECONDS,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, seconds):
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        waiting_for_io = bool(self.in_flight and self.in_flight())
+        self.stacks[tuple(stack), waiting_for_io] += 1
+        self.samples += 1
+
+    def categories(self):
+        totals = collections.Counter()
+        for key, count in self.stacks.items():
+            totals[category_of(*key)] += count
+        return totals
+
+    def collapsed(self):
+        lines = []
+        for (stack, waiting_for_io), count in self.stacks.most_common():
+            category = category_of(stack, waiting_for_io)
+            frames = [f"[{category}]"] + [describe(code) for code in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        total = self.samples or 1
+        return "\n".join(
+            f"{count / total:>6.1%} {category}"
+            for category, count in self.categories().most_common()
+        )
+
+
+class Profiler:
+    """Runs one sampler at a time and writes what it finds to PROFILE_DIR."""
+
+    def __init__(self, thread_id=None, directory=None, in_flight=None):
+        self.sampler = Sampler(thread_id, in_flight=in_flight)
+        self.directory = directory or PROFILE_DIR
+        self.task = None
+
+    async def profile(self, seconds=None):
+        """Sample for seconds, then write the profile. Returns the collapsed
+        stacks, or None if a profile was already being taken."""
+        if self.sampler.running:
+            return None
+
+        seconds = min(seconds or PROFILE_SECONDS, MAX_PROFILE_SECONDS)
+        print(f"Profiling for {seconds}s")
+        self.sampler.start(seconds)
+        while self.sampler.running:
+            await asyncio.sleep(0.1)
+
+        collapsed = self.sampler.collapsed()
+        path = await asyncio.to_thread(self.write, collapsed)
+        print(
+            f"Wrote {self.sampler.samples} samples to {path}\n{self.sampler.summary()}"
+        )
+        return collapsed
+
+    def write(self, collapsed):
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        path = os.path.join(self.directory, f"pets-profile-{stamp}.folded")
+        with open(path, "w", encoding="utf-8") as profile:
+            profile.write(collapsed)
+        return path
+
+    def toggle(self):
+        """Start a profile, or finish the one that's running early."""
+        if self.sampler.running:
+            self.sampler.stop()
+        else:
+            self.task = asyncio.create_task(self.profile())
+
+    def install_signal_handler(self, signum=signal.SIGUSR2):
+        asyncio.get_running_loop().add_signal_handler(signum, self.toggle)
+
+    async def handle_request(self, query):
+        """Metrics server handler: GET /profile?seconds=N returns the
+        collapsed stacks once the profile is done."""
+        seconds = urllib.parse.parse_qs(query).get("seconds", [None])[0]
+        try:
+            seconds = float(seconds) if seconds else None
+        except ValueError:
+            return "400 Bad Request", "seconds must be a number\n"
+
+        collapsed = await self.profile(seconds)
+        if collapsed is None:
+            return "409 Conflict", "A profile is already running\n"
+        return "200 OK", collapsed
@@ -0,0 +1,162 @@
+"""Global rate limiting for RC Together REST calls."""
+
+import asyncio
+import collections
+import os
+import time
+
+import rctogether
+
+from . import priority
+from .transport import SessionWrapper
+
+# Requests per second shared by every REST call the process makes.
+RATE_LIMIT = float(os.environ.get("RC_RATE_LIMIT", "20"))
+MIN_RATE = 1.0
+
+# AIMD tuning: add this many requests/second per successful call, and multiply
+# by this factor when the server tells us to slow down.
+RATE_INCREASE = 0.1
+RATE_DECREASE = 0.5
+
+THROTTLED_STATUSES = {429, 503}
+
+# Share of tokens each priority lane gets when they are all busy, and how long
+# (in seconds) a request in each lane may wait before it jumps the queue.
+LANE_WEIGHTS = {
+    priority.REPLY: 16,
+    priority.RENAME: 4,
+    priority.FOLLOW: 2,
+    priority.WANDER: 1,
+}
+LATENCY_TARGETS = {
+    priority.REPLY: 0.5,
+    priority.RENAME: 2.0,
+    priority.FOLLOW: 5.0,
+    priority.WANDER: None,
+}
+
+
+class RateLimiter:
+    """Token bucket whose fill rate adapts to server throttling (AIMD).
+
+    Waiters are queued in priority lanes (see priority.py) and served by
+    weighted fair queueing: while every lane is busy, each gets tokens in
+    proportion to its LANE_WEIGHTS, and a request that has waited longer than
+    its lane's LATENCY_TARGETS is served next. Within a lane, waiters are
+    served in FIFO order. `rate`, `waiting` and `last_wait` are kept up to
+    date so they can be reported.
+    """
+
+    def __init__(self, rate=None, burst=None, min_rate=None):
+        self.max_rate = rate or RATE_LIMIT
+        self.min_rate = min(min_rate or MIN_RATE, self.max_rate)
+        self.rate = self.max_rate
+        self.burst = burst or max(1.0, self.max_rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lanes = {lane: collections.deque() for lane in priority.PRIORITIES}
+        self.finish_times = dict.fromkeys(priority.PRIORITIES, 0.0)
+        self.virtual_time = 0.0
+        self.scheduler = None
+        self.waiting = 0
+        self.last_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, lane=None):
+        lane = priority.current() if lane is None else lane
+        started = time.monotonic()
+
+        self._refill()
+        if self.tokens >= 1 and not self.waiting:
+            self.tokens -= 1
+            self._charge(lane)
+            self.last_wait = 0.0
+            return
+
+        granted = asyncio.get_running_loop().create_future()
+        self.lanes[lane].append((started, granted))
+        self.waiting += 1
+        if self.scheduler is None or self.scheduler.done():
+            self.scheduler = asyncio.create_task(self._schedule())
+        try:
+            await granted
+        finally:
+            self.waiting -= 1
+        self.last_wait = time.monotonic() - started
+
+    def _charge(self, lane):
+        start = max(self.finish_times[lane], self.virtual_time)
+        self.finish_times[lane] = start + 1 / LANE_WEIGHTS[lane]
+        self.virtual_time = start
+
+    def _next_lane(self, now):
+        busy = [lane for lane in priority.PRIORITIES if self.lanes[lane]]
+        for lane in busy:
+            target = LATENCY_TARGETS[lane]
+            if target is not None and now - self.lanes[lane][0][0] > target:
+                return lane
+        return min(
+            busy,
+            key=lambda lane: (max(self.finish_times[lane], self.virtual_time), lane),
+        )
+
+    async def _schedule(self):
+        while any(self.lanes.values()):
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            lane = self._next_lane(time.monotonic())
+            _, granted = self.lanes[lane].popleft()
+            if granted.done():
+                # The waiter was cancelled.
+                continue
+            self.tokens -= 1
+            self._charge(lane)
+            granted.set_result(None)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    def on_throttled(self):
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+        print(f"Throttled by server, rate limit now {self.rate:.1f}/s")
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "waiting": self.waiting,
+            "waiting_by_lane": {
+                priority.NAMES[lane]: len(waiters)
+                for lane, waiters in self.lanes.items()
+            },
+            "last_wait": self.last_wait,
+        }
+
+
+class RateLimitedSession(SessionWrapper):
+    """Wraps a RestApiSession so that every request goes through a RateLimiter."""
+
+    def __init__(self, session, limiter=None):
+        super().__init__(session)
+        self.limiter = limiter or RateLimiter()
+
+    async def _request(self, method, *args, **kwargs):
+        await self.limiter.acquire()
+        try:
+            result = await super()._request(method, *args, **kwargs)
+        except rctogether.api.HttpError as exc:
+            if exc.args and exc.args[0] in THROTTLED_STATUSES:
+                self.limiter.on_throttled()
+            raise
+        self.limiter.on_success()
+        return result
@@ -0,0 +1,138 @@
+"""Recording live entity streams, and replaying them into an agency."""
+
+import asyncio
+import datetime
+import glob
+import gzip
+import json
+import os
+import time
+import zlib
+
+MAX_RECORDING_BYTES = 64 * 2**20
+MAX_RECORDING_FILES = 24
+FLUSH_INTERVAL = 5.0
+
+
+def recording_files(prefix):
+    """The files a Recorder with this prefix has written, oldest first."""
+    return sorted(glob.glob(glob.escape(prefix) + "-*.jsonl.gz"))
+
+
+class Recorder:
+    """Appends entities, with their arrival time, to gzipped JSONL files.
+
+    Each line is {"t": unix time, "entity": entity}. Files are named
+    <prefix>-<timestamp>-<n>.jsonl.gz; a new one is started once the current
+    one holds MAX_RECORDING_BYTES of uncompressed JSON, and only the newest
+    MAX_RECORDING_FILES are kept. Data is flushed every FLUSH_INTERVAL seconds,
+    so a crash loses at most that much.
+    """
+
+    def __init__(self, prefix, max_bytes=None, max_files=None):
+        self.prefix = prefix
+        self.max_bytes = max_bytes or MAX_RECORDING_BYTES
+        self.max_files = max_files or MAX_RECORDING_FILES
+        self._file = None
+        self._written = 0
+        self._sequence = 0
+        self._flushed_at = 0.0
+
+    def record(self, entity, now=None):
+        now = time.time() if now is None else now
+        if self._file is None:
+            self._open()
+
+        line = json.dumps({"t": now, "entity": entity}, ensure_ascii=False) + "\n"
+        data = line.encode("utf-8")
+        self._file.write(data)
+        self._written += len(data)
+
+        if self._written >= self.max_bytes:
+            self.close()
+        elif now - self._flushed_at >= FLUSH_INTERVAL:
+            self._file.flush()
+            self._flushed_at = now
+
+    def _open(self):
+        directory = os.path.dirname(self.prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self._file = gzip.open(
+            f"{self.prefix}-{stamp}-{self._sequence:04d}.jsonl.gz", "wb"
+        )
+        self._sequence += 1
+        self._written = 0
+
+        for path in recording_files(self.prefix)[: -self.max_files]:
+            os.remove(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def recorded(entities, recorder):
+    """Pass entities through, recording each one as it arrives."""
+    try:
+        async for entity in entities:
+            recorder.record(entity)
+            yield entity
+    finally:
+        recorder.close()
+
+
+def read(paths):
+    """Yield (arrival time, entity) from recordings, in the order given.
+
+    A file cut short by a crash is read up to the last complete line.
+    """
+    for path in paths:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as recording:
+                for line in recording:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Skipping incomplete line in {path}")
+                        break
+                    yield record["t"], record["entity"]
+        except (EOFError, gzip.BadGzipFile, zlib.error) as exc:
+            print(f"Recording {path} is truncated: {exc!r}")
+
+
+async def replay(agency, records, speed=1.0):
+    """Feed recorded entities into agency.handle_entity.
+
+    speed scales the recorded gaps between entities (2.0 is twice as fast);
+    None or 0 replays as fast as the agency will take them. Messages sent
+    before the recording started are ignored, as they would have been live.
+    Returns the number of entities replayed and how far, in seconds, the
+    replay fell behind the recorded schedule at worst.
+    """
+    count = 0
+    max_behind = 0.0
+    started = None
+
+    for arrived_at, entity in records:
+        if started is None:
+            started = (arrived_at, time.monotonic())
+            agency.processed_message_dt = datetime.datetime.fromtimestamp(
+                arrived_at, datetime.timezone.utc
+            )
+
+        if speed:
+            due = started[1] + (arrived_at - started[0]) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_behind = max(max_behind, -delay)
+
+        await agency.handle_entity(entity)
+        count += 1
+
+    return {"entities": count, "max_behind": max_behind}
@@ -0,0 +1,29 @@
+"""Local snapshots of the bot listing, in the same shape as bin/save_bots.py."""
+
+import json
+import os
+
+
+def load(path):
+    """Return the saved bot listing, or None if there isn't a usable one."""
+    try:
+        with open(path, encoding="utf-8") as snapshot_file:
+            bots = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        print(f"Ignoring unreadable snapshot {path!r}: {exc!r}")
+        return None
+
+    if not isinstance(bots, list):
+        print(f"Ignoring snapshot {path!r}: not a list of bots")
+        return None
+
+    return bots
+
+
+def save(path, bots):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+        json.dump(bots, snapshot_file)
+    os.replace(tmp_path, path)
@@ -0,0 +1,62 @@
+"""A stand-in for rctogether.RestApiSession that never touches the network.
+
+Used to drive the agency from benchmarks and recorded traffic.
+"""
+
+import asyncio
+import collections
+import itertools
+import time
+
+
+class StandInSession:
+    """Answers REST calls locally, optionally after a fixed latency.
+
+    Every call is counted by (method, resource), and on_call(method, resource,
+    resource_id, json) is called as each one is made.
+    """
+
+    def __init__(self, bots=(), latency=0.0, on_call=None):
+        self.bots = list(bots)
+        self.latency = latency
+        self.on_call = on_call
+        self.calls = collections.Counter()
+        self.ids = itertools.count(max((bot["id"] for bot in self.bots), default=0) + 1)
+
+    async def _call(self, method, resource, resource_id=None, json=None):
+        self.calls[(method, resource)] += 1
+        if self.on_call:
+            self.on_call(method, resource, resource_id, json)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    async def get(self, resource):
+        await self._call("get", resource)
+        return list(self.bots) if resource == "bots" else []
+
+    async def post(self, resource, json):
+        await self._call("post", resource, json=json)
+        if resource != "bots":
+            return {}
+
+        bot = json["bot"]
+        return {
+            "type": "Bot",
+            "id": next(self.ids),
+            "name": bot["name"],
+            "emoji": bot["emoji"],
+            "pos": {"x": bot["x"], "y": bot["y"]},
+            "direction": bot["direction"],
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+
+    async def patch(self, resource, resource_id, json):
+        await self._call("patch", resource, resource_id, json)
+        return {}
+
+    async def delete(self, resource, resource_id, json=None):
+        await self._call("delete", resource, resource_id, json)
+        return {}
@@ -0,0 +1,37 @@
+"""Websocket subscription that survives dropped connections."""
+
+import asyncio
+import random
+
+import rctogether
+
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
+
+async def supervised_subscription(on_reconnect=None, subscribe=None):
+    """Yield entities from the websocket forever, reconnecting with backoff.
+
+    on_reconnect() is awaited before each reconnection so the caller can catch
+    up on anything it missed while the socket was down.
+    """
+    subscribe = subscribe or rctogether.WebsocketSubscription
+    delay = RECONNECT_DELAY
+
+    while True:
+        try:
+            async for entity in subscribe():
+                delay = RECONNECT_DELAY
+                yield entity
+            print("Websocket closed.")
+        except Exception as exc:
+            print(f"Websocket failed: {exc!r}")
+
+        await asyncio.sleep(delay * random.uniform(0.5, 1))
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+        if on_reconnect:
+            try:
+                await on_reconnect()
+            except Exception as exc:
+                print(f"Resync after reconnect failed: {exc!r}")
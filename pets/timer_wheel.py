@@ -0,0 +1,82 @@
+"""Hashed timer wheel for large numbers of coarse, frequently reset timers."""
+
+import asyncio
+import math
+
+TICK = 1.0
+
+
+class TimerWheel:
+    """Calls callback(key) once the deadline set for key has passed.
+
+    Deadlines are rounded up to a whole tick and kept in per-tick buckets, so
+    setting, resetting and cancelling a timer are all O(1). A single loop
+    callback runs once per tick while any timers are pending and fires every
+    key in the buckets that have expired.
+    """
+
+    def __init__(self, callback, tick=None):
+        self.callback = callback
+        self.tick = tick or TICK
+        self.deadlines = {}
+        self.buckets = {}
+        self.next_slot = None
+        self.handle = None
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def reset(self, key, delay):
+        self.cancel(key)
+
+        loop = asyncio.get_running_loop()
+        slot = math.ceil((loop.time() + delay) / self.tick)
+        self.deadlines[key] = slot
+        self.buckets.setdefault(slot, set()).add(key)
+
+        if self.handle is None:
+            self.next_slot = math.floor(loop.time() / self.tick)
+            self.handle = loop.call_later(self.tick, self._tick)
+
+    def cancel(self, key):
+        slot = self.deadlines.pop(key, None)
+        if slot is None:
+            return
+
+        bucket = self.buckets[slot]
+        bucket.discard(key)
+        if not bucket:
+            del self.buckets[slot]
+
+    def clear(self):
+        self.deadlines.clear()
+        self.buckets.clear()
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+
+    def _tick(self):
+        loop = asyncio.get_running_loop()
+        now_slot = math.floor(loop.time() / self.tick)
+
+        expired = []
+        while self.next_slot <= now_slot:
+            expired.extend(self.buckets.pop(self.next_slot, ()))
+            self.next_slot += 1
+
+        for key in expired:
+            del self.deadlines[key]
+
+        for key in expired:
+            try:
+                self.callback(key)
+            except Exception as exc:
+                print(f"Timer callback failed: {key!r}, {exc!r}")
+
+        if self.deadlines:
+            self.handle = loop.call_later(self.tick, self._tick)
+        else:
+            self.handle = None
@@ -0,0 +1,163 @@
+"""Sampled tracing of entities through the agency, as a Chrome trace.
+
+A Trace is started for a sample of incoming entities, travels with the
+entity through the pipeline and the update queues, and is made current with
+activate() while its events are applied, so that REST calls made on its behalf
+are recorded against it. Spans are written as they finish in the Chrome trace
+event format, which chrome://tracing and https://ui.perfetto.dev can open;
+each trace is drawn as its own row.
+"""
+
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import random
+import time
+
+from .constants import TRACE_SAMPLE_RATE
+from .transport import SessionWrapper
+
+MAX_TRACE_BYTES = 64 * 2**20
+FLUSH_INTERVAL = 5.0
+
+# The traces that work in the current task is being done for. Updates for
+# several entities can be merged into one REST call, so there may be more
+# than one.
+_current = contextvars.ContextVar("traces", default=())
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(traces):
+    """Make traces (a Trace, a sequence of them, or None) current."""
+    if traces is None:
+        traces = ()
+    elif isinstance(traces, Trace):
+        traces = (traces,)
+    token = _current.set(tuple(traces))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class Trace:
+    def __init__(self, tracer, trace_id):
+        self.tracer = tracer
+        self.id = trace_id
+
+    def add_span(self, name, start, end, **args):
+        """Record a span between two time.monotonic() readings."""
+        self.tracer.write(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": self.tracer.timestamp(start),
+                "dur": max(0.0, (end - start) * 1e6),
+                "tid": self.id,
+                "args": args,
+            }
+        )
+
+
+class Tracer:
+    """Writes the spans of a sample of traces to a file.
+
+    The file is a JSON array that is never closed, which the trace viewers
+    accept, so that it is still readable if the process dies. Spans are
+    buffered and written every FLUSH_INTERVAL seconds, and on close(). Once
+    the file holds MAX_TRACE_BYTES it is moved to <path>.1, replacing the
+    one before, and a new one is started.
+    """
+
+    def __init__(self, path, sample_rate=None, max_bytes=None):
+        self.path = path
+        self.sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.max_bytes = max_bytes or MAX_TRACE_BYTES
+        self.ids = itertools.count(1)
+        self.pid = os.getpid()
+        self.epoch = time.time() - time.monotonic()
+        self.buffer = []
+        self.flushed_at = time.monotonic()
+        self.file = None
+        self.written = 0
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.file.write("[\n")
+        self.file.flush()
+        self.written = 2
+
+    def timestamp(self, monotonic):
+        return (self.epoch + monotonic) * 1e6
+
+    def write(self, event):
+        event.setdefault("cat", "pets")
+        event["pid"] = self.pid
+        self.buffer.append(json.dumps(event, ensure_ascii=False) + ",\n")
+        if time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not self.buffer:
+            return
+        data = "".join(self.buffer)
+        self.buffer.clear()
+        self.file.write(data)
+        self.file.flush()
+        self.written += len(data)
+        if self.written >= self.max_bytes:
+            self.file.close()
+            os.replace(self.path, f"{self.path}.1")
+            self._open()
+
+    def start(self, entity):
+        """Start a trace for a sample of entities, or return None."""
+        if random.random() >= self.sample_rate:
+            return None
+
+        trace = Trace(self, next(self.ids))
+        self.write(
+            {
+                "name": f"{entity['type']} {entity['id']}",
+                "ph": "i",
+                "s": "t",
+                "ts": self.timestamp(time.monotonic()),
+                "tid": trace.id,
+                "args": {"entity": entity},
+            }
+        )
+        return trace
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class TracedSession(SessionWrapper):
+    """Wraps a RestApiSession, recording a span for each request against the
+    current traces."""
+
+    async def _request(self, verb, resource, *args, **kwargs):
+        traces = current()
+        if not traces:
+            return await super()._request(verb, resource, *args, **kwargs)
+
+        start = time.monotonic()
+        status = "ok"
+        try:
+            return await super()._request(verb, resource, *args, **kwargs)
+        except Exception as exc:
+            status = repr(exc)
+            raise
+        finally:
+            end = time.monotonic()
+            for trace in traces:
+                trace.add_span(f"{verb.upper()} {resource}", start, end, status=status)
@@ -0,0 +1,208 @@
+"""The stack of session wrappers every RC Together REST call goes through.
+
+    RetryingSession       retries idempotent PATCH/DELETE with jittered backoff,
+                          within a retry budget
+    BreakerSession        one circuit breaker per endpoint
+                          (see circuit_breaker.py)
+    RateLimitedSession    shares the request budget (see rate_limit.py)
+    [TracedSession]       optional, see tracing.py
+    [MeteredSession]      optional, see metrics.py
+    PooledSession         bounded concurrency, per-request timeouts, and
+                          classification of errors
+    RestApiSession        one aiohttp session, keeping connections alive
+
+Every layer is a SessionWrapper. Use connect() to build the stack.
+"""
+
+import asyncio
+import contextlib
+import random
+
+import aiohttp
+import rctogether
+
+REQUEST_TIMEOUT = 10.0
+MAX_CONCURRENT_REQUESTS = 16
+KEEPALIVE_SECONDS = 30.0
+
+MAX_RETRIES = 3
+RETRY_DELAY = 0.25
+MAX_RETRY_DELAY = 5.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Each request earns this fraction of a retry, up to MAX_RETRY_TOKENS saved,
+# so that retries add at most about 20% to the load on a failing server.
+RETRY_BUDGET = 0.2
+MAX_RETRY_TOKENS = 10.0
+
+
+class BlockedPosition(rctogether.api.HttpError):
+    """The server refused to put a bot on a square that is blocked."""
+
+
+class RequestTimeout(rctogether.api.HttpError):
+    """A request took longer than REQUEST_TIMEOUT. Its status is None."""
+
+
+def classify(exc):
+    """Turn a generic HttpError into a more specific one where we can."""
+    if (
+        type(exc) is rctogether.api.HttpError
+        and len(exc.args) >= 2
+        and exc.args[0] == 422
+        and "must not be in a block" in str(exc.args[1])
+    ):
+        return BlockedPosition(*exc.args)
+    return exc
+
+
+class SessionWrapper:
+    """Base class for the layers of the stack.
+
+    get, post, patch and delete all go through _request(method, ...), which
+    subclasses override; the default just passes the call on. Any other
+    attribute is looked up on the wrapped session.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    async def _request(self, method, *args, **kwargs):
+        return await getattr(self.session, method)(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await self._request("get", *args, **kwargs)
+
+    async def post(self, *args, **kwargs):
+        return await self._request("post", *args, **kwargs)
+
+    async def patch(self, *args, **kwargs):
+        return await self._request("patch", *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self._request("delete", *args, **kwargs)
+
+
+def is_transient(exc):
+    if isinstance(exc, (RequestTimeout, aiohttp.ClientError)):
+        return True
+    return (
+        isinstance(exc, rctogether.api.HttpError)
+        and bool(exc.args)
+        and exc.args[0] in RETRY_STATUSES
+    )
+
+
+class PooledSession(SessionWrapper):
+    """Bounds how many requests are in flight at once, and how long each may
+    take.
+
+    Timeouts are raised as RequestTimeout, and connection failures as
+    aiohttp.ClientError, so callers only need to handle HttpError and that.
+    """
+
+    def __init__(self, session, max_concurrent=None, timeout=None):
+        super().__init__(session)
+        self.semaphore = asyncio.Semaphore(max_concurrent or MAX_CONCURRENT_REQUESTS)
+        self.timeout = timeout or REQUEST_TIMEOUT
+        self.in_flight = 0
+
+    async def _request(self, method, *args, **kwargs):
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                return await asyncio.wait_for(
+                    super()._request(method, *args, **kwargs), self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise RequestTimeout(None, f"{method} timed out") from None
+            except rctogether.api.HttpError as exc:
+                classified = classify(exc)
+                if classified is exc:
+                    raise
+                raise classified from None
+            finally:
+                self.in_flight -= 1
+
+
+class RetryingSession(SessionWrapper):
+    """Retries PATCH and DELETE after transient failures.
+
+    Both are idempotent, so repeating one is safe even if the first attempt
+    reached the server. POST is not retried, since a repeated message or
+    created bot would be visible. A DELETE that is retried and then finds
+    the bot already gone has succeeded.
+
+    Retries are paid for from a budget that every request adds to, so when
+    most requests are failing we stop retrying rather than multiply the load.
+    """
+
+    def __init__(self, session, max_retries=None):
+        super().__init__(session)
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.retry_tokens = MAX_RETRY_TOKENS
+
+    async def _request(self, method, *args, **kwargs):
+        if method not in ("patch", "delete"):
+            return await super()._request(method, *args, **kwargs)
+
+        self.retry_tokens = min(MAX_RETRY_TOKENS, self.retry_tokens + RETRY_BUDGET)
+        delay = RETRY_DELAY
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await super()._request(method, *args, **kwargs)
+            except (rctogether.api.HttpError, aiohttp.ClientError) as exc:
+                if (
+                    method == "delete"
+                    and attempt
+                    and isinstance(exc, rctogether.api.HttpError)
+                    and exc.args[:1] == (404,)
+                ):
+                    return {}
+                if (
+                    attempt == self.max_retries
+                    or not is_transient(exc)
+                    or self.retry_tokens < 1
+                ):
+                    raise
+                self.retry_tokens -= 1
+                print(f"Retrying {method} after {exc!r}")
+
+            await asyncio.sleep(random.uniform(0, delay))
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+def wrap(session, metered=False, traced=False, limiter=None):
+    """Wrap a bare session in the rest of the stack."""
+    # These layers subclass SessionWrapper, so can't be imported at the top.
+    from . import metrics, tracing
+    from .circuit_breaker import BreakerSession
+    from .rate_limit import RateLimitedSession
+
+    session = PooledSession(session)
+    if metered:
+        session = metrics.MeteredSession(session)
+    if traced:
+        session = tracing.TracedSession(session)
+    return RetryingSession(
+        BreakerSession(RateLimitedSession(session, limiter), is_transient)
+    )
+
+
+@contextlib.asynccontextmanager
+async def connect(metered=False, traced=False, limiter=None):
+    """Open an RC Together session wrapped in the full stack."""
+    rest = rctogether.RestApiSession()
+    # Replace the default aiohttp session with one that keeps connections
+    # alive for longer, and allows as many as we'll ever have in flight.
+    await rest.session.close()
+    rest.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=MAX_CONCURRENT_REQUESTS, keepalive_timeout=KEEPALIVE_SECONDS
+        )
+    )
+    async with rest:
+        yield wrap(rest, metered=metered, traced=traced, limiter=limiter)
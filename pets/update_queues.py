@@ -1,73 +1,219 @@
 import asyncio
+import collections
+import itertools
+import time
+
 import rctogether
 
+from . import priority, tracing
+from .circuit_breaker import CLOSED, CircuitOpen
+
 SLEEP_AFTER_UPDATE = 0.5
+WORKERS = 8
+# While a circuit is open, how often to check whether a parked update can be
+# sent as a probe.
+PARKED_CHECK_INTERVAL = 1.0
+# Once this many pets are waiting for a worker, wandering pets stay put.
+MAX_READY_FOR_WANDERS = 50
 
 
 class UpdateQueues:
-    def __init__(self, queue_iterator):
-        self.queues = {}
-        self.tasks = {}
-        self.queue_iterator = queue_iterator
-
-    async def add_task(self, queue_id, task):
-        if queue_id not in self.queues:
-            queue = asyncio.Queue()
-            self.queues[queue_id] = queue
-            self.tasks[queue_id] = asyncio.create_task(self.run(queue_id, queue))
-
-        await self.queues[queue_id].put(task)
+    """Sends queued bot updates with a fixed pool of workers.
+
+    Updates are plain dicts of bot attributes. Updates for the same queue id
+    are sent one at a time and no more often than every SLEEP_AFTER_UPDATE
+    seconds. Updates that arrive while a queue is busy are merged field by
+    field (last writer wins), and send(queue_id, update) is only called once
+    a worker is ready, so one request carries every pending change. Queue
+    state is only kept while a queue has updates pending or is cooling down.
+
+    Each queue is sent at the highest priority (see priority.py) of the
+    updates merged into it, and workers take the highest priority queue that
+    is ready first. When the backlog is long, wanders are dropped.
+
+    If an update is refused because its circuit breaker is open, the queue is
+    parked: later updates keep merging into it, and it is sent once the
+    circuit closes again.
+    """
+
+    def __init__(self, send, workers=None):
+        self.send = send
+        self.pending = {}
+        self.traces = {}
+        self.active = set()
+        self.parked = {}
+        self.unparkers = {}
+        self.priorities = {}
+        # Queues waiting for a worker, and the lane of their live entry in
+        # ready. Entries that have since been pushed at a better lane are
+        # stale, and skipped.
+        self.queued = {}
+        self.ready = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        self.dropped = 0
+        self.num_workers = workers or WORKERS
+        self.workers = []
+        self.sending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def _start(self):
+        if not self.workers:
+            self.workers = [
+                asyncio.create_task(self.run()) for _ in range(self.num_workers)
+            ]
+
+    def add_update(self, queue_id, update, lane=None):
+        lane = priority.current() if lane is None else lane
+        if (
+            lane == priority.WANDER
+            and queue_id not in self.pending
+            and len(self.queued) >= MAX_READY_FOR_WANDERS
+        ):
+            self.dropped += 1
+            return
 
-    async def run(self, queue_id, queue):
-        async for task in self.queue_iterator(queue, queue_id):
+        self._start()
+        self.pending.setdefault(queue_id, {}).update(update)
+        self.priorities[queue_id] = min(lane, self.priorities.get(queue_id, lane))
+
+        traces = tracing.current()
+        if traces:
+            added_at = time.monotonic()
+            self.traces.setdefault(queue_id, []).extend(
+                (trace, added_at) for trace in traces
+            )
+
+        if queue_id not in self.active:
+            self.active.add(queue_id)
+            self.idle.clear()
+            self._put_ready(queue_id)
+        elif (
+            queue_id in self.queued
+            and self.priorities[queue_id] < self.queued[queue_id]
+        ):
+            # Already waiting for a worker, but now more urgent. Queues that
+            # are sending or cooling down are put back by _release.
+            self._put_ready(queue_id)
+
+    def _put_ready(self, queue_id):
+        lane = self.priorities.get(queue_id, priority.REPLY)
+        self.queued[queue_id] = lane
+        self.ready.put_nowait((lane, next(self.order), queue_id))
+
+    async def run(self):
+        while True:
+            lane, _, queue_id = await self.ready.get()
+            if self.queued.get(queue_id) != lane:
+                continue
+            del self.queued[queue_id]
+            update = self.pending.pop(queue_id, None)
+            lane = self.priorities.pop(queue_id, lane)
+
+            if update is None:
+                self._release(queue_id)
+                continue
+
+            traces = self.traces.pop(queue_id, ())
+            started = time.monotonic()
+            for trace, added_at in traces:
+                trace.add_span("update queue wait", added_at, started)
+
+            self.sending += 1
             try:
-                await task
+                with tracing.activate(trace for trace, _ in traces), priority.use(lane):
+                    await self.send(queue_id, update)
+            except CircuitOpen as exc:
+                self._park(queue_id, update, lane, exc.breaker)
+                continue
             except rctogether.api.HttpError as exc:
                 print(f"Update failed: {queue_id!r}, {exc!r}")
-
-            await asyncio.sleep(SLEEP_AFTER_UPDATE)
-
-    async def close(self):
-        for queue in self.queues.values():
-            await queue.put(None)
-
-        for task in self.tasks.values():
-            await task
-
-
-async def get_all_available_updates(queue):
-    updates = []
-    updates.append(await queue.get())
-
-    while not queue.empty():
-        update = await queue.get()
-        updates.append(update)
-        if update is None:
-            break
-
-    return updates
-
-
-async def deduplicated_updates(queue, queue_id=None):
-    while True:
-        updates = await get_all_available_updates(queue)
-
-        if updates[-1] is None:
-            while updates and updates[-1] is None:
-                updates.pop()
-
-            # Close discarded coroutines to avoid RuntimeWarning
-            for update in updates[:-1] if updates else []:
-                if hasattr(update, 'close'):
-                    update.close()
-
-            if updates:
-                yield updates[-1]
+            except Exception as exc:
+                print(f"Update crashed: {queue_id!r}, {exc!r}")
+            finally:
+                self.sending -= 1
+
+            for trace, _ in traces:
+                trace.add_span(
+                    "send update", started, time.monotonic(), traces=len(traces)
+                )
+
+            asyncio.get_running_loop().call_later(
+                SLEEP_AFTER_UPDATE, self._release, queue_id
+            )
+
+    def _park(self, queue_id, update, lane, breaker):
+        # Anything added while we were trying to send is newer.
+        self.pending[queue_id] = {**update, **self.pending.get(queue_id, {})}
+        self.priorities[queue_id] = min(lane, self.priorities.get(queue_id, lane))
+        self.parked[queue_id] = breaker
+        if breaker.name not in self.unparkers:
+            self.unparkers[breaker.name] = asyncio.create_task(self._unpark(breaker))
+
+    async def _unpark(self, breaker):
+        try:
+            while True:
+                await asyncio.sleep(max(breaker.retry_after(), PARKED_CHECK_INTERVAL))
+                waiting = [
+                    queue_id
+                    for queue_id, parked_on in self.parked.items()
+                    if parked_on is breaker
+                ]
+                if not waiting:
+                    return
+
+                # Once closed, send everything; until then, one at a time
+                # to probe the half-open circuit.
+                for queue_id in waiting if breaker.state == CLOSED else waiting[:1]:
+                    del self.parked[queue_id]
+                    self._release(queue_id)
+        finally:
+            del self.unparkers[breaker.name]
+
+    def _release(self, queue_id):
+        if queue_id in self.pending:
+            self._put_ready(queue_id)
             return
 
-        # Close discarded coroutines to avoid RuntimeWarning
-        for update in updates[:-1]:
-            if hasattr(update, 'close'):
-                update.close()
+        self.active.discard(queue_id)
+        if not self.active:
+            self.idle.set()
+
+    def remove(self, queue_id):
+        """Drop any updates that haven't been sent yet."""
+        self.pending.pop(queue_id, None)
+        self.priorities.pop(queue_id, None)
+        self.traces.pop(queue_id, None)
+        if self.parked.pop(queue_id, None):
+            self._release(queue_id)
+
+    def depth(self):
+        return len(self.pending)
+
+    def stats(self):
+        lanes = collections.Counter(self.priorities.values())
+        return {
+            "pending": len(self.pending),
+            "pending_by_lane": {
+                name: lanes[lane] for lane, name in priority.NAMES.items()
+            },
+            "active": len(self.active),
+            "ready": len(self.queued),
+            "sending": self.sending,
+            "parked": len(self.parked),
+            "dropped": self.dropped,
+        }
 
-        yield updates[-1]
+    async def close(self):
+        if self.parked:
+            print(f"Dropping {len(self.parked)} updates waiting for a circuit")
+            for queue_id in list(self.parked):
+                self.remove(queue_id)
+
+        await self.idle.wait()
+
+        tasks = [*self.workers, *self.unparkers.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
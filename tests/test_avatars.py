@@ -0,0 +1,56 @@
+import pets.avatars
+from pets.avatars import AvatarCache
+
+
+def avatar(avatar_id, x=0):
+    return {
+        "type": "Avatar",
+        "id": avatar_id,
+        "person_name": f"Person {avatar_id}",
+        "pos": {"x": x, "y": 0},
+        "message": {"text": "a long message body we never read"},
+    }
+
+
+def test_keeps_only_what_we_use():
+    cache = AvatarCache()
+    cache.update(avatar(1, x=5))
+
+    assert cache.get(1).entity() == {
+        "id": 1,
+        "person_name": "Person 1",
+        "pos": {"x": 5, "y": 0},
+    }
+    assert cache.get(2) is None
+
+
+def test_evicts_least_recently_seen():
+    evicted = []
+    cache = AvatarCache(max_size=2, on_evict=evicted.append)
+
+    cache.update(avatar(1))
+    cache.update(avatar(2))
+    cache.update(avatar(1, x=3))
+    cache.update(avatar(3))
+
+    assert evicted == [2]
+    assert 2 not in cache
+    assert cache.get(1).x == 3
+    assert len(cache) == 2
+
+
+def test_evicts_avatars_not_seen_recently(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(pets.avatars.time, "monotonic", lambda: now[0])
+    evicted = []
+    cache = AvatarCache(ttl=10, on_evict=evicted.append)
+
+    cache.update(avatar(1))
+    now[0] += 5
+    cache.update(avatar(2))
+    now[0] += 6
+
+    assert cache.get(1) is None
+    cache.update(avatar(2))
+    assert evicted == [1]
+    assert len(cache) == 1
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+import rctogether
+
+import pets.circuit_breaker
+import pets.update_queues
+from pets.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerSession,
+    CircuitBreaker,
+    CircuitOpen,
+)
+from pets.transport import is_transient
+from pets.update_queues import UpdateQueues
+
+pets.update_queues.SLEEP_AFTER_UPDATE = 0.01
+
+
+@pytest.fixture(autouse=True)
+def short_timings(monkeypatch):
+    monkeypatch.setattr(pets.circuit_breaker, "MIN_REQUESTS", 4)
+    monkeypatch.setattr(pets.circuit_breaker, "OPEN_SECONDS", 0.05)
+    monkeypatch.setattr(pets.update_queues, "PARKED_CHECK_INTERVAL", 0.01)
+
+
+class FailingServer:
+    """Fails every request with a 503 until told to recover."""
+
+    def __init__(self):
+        self.healthy = False
+        self.received = []
+
+    async def _respond(self, method, resource, json):
+        if not self.healthy:
+            raise rctogether.api.HttpError(503, "Service Unavailable")
+        self.received.append((method, resource, json))
+        return {}
+
+    async def post(self, resource, json):
+        return await self._respond("post", resource, json)
+
+    async def patch(self, resource, resource_id, json):
+        return await self._respond("patch", resource, {"id": resource_id, **json})
+
+
+def test_opens_probes_and_closes():
+    breaker = CircuitBreaker("bots update")
+
+    for _ in range(4):
+        breaker.before_request()
+        breaker.record(failed=True)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpen):
+        breaker.before_request()
+
+    breaker.opened_at -= 1
+    breaker.before_request()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time.
+    with pytest.raises(CircuitOpen):
+        breaker.before_request()
+
+    breaker.record(failed=False)
+    assert breaker.state == CLOSED
+    breaker.before_request()
+
+
+def test_stays_closed_below_failure_rate():
+    breaker = CircuitBreaker("messages")
+    for failed in [True, False, False, False, True, False, False, False]:
+        breaker.before_request()
+        breaker.record(failed)
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_endpoints_break_separately():
+    server = FailingServer()
+    session = BreakerSession(server, is_transient)
+
+    for _ in range(4):
+        with pytest.raises(rctogether.api.HttpError):
+            await session.patch("bots", 1, {"x": 1})
+    with pytest.raises(CircuitOpen):
+        await session.patch("bots", 1, {"x": 1})
+
+    server.healthy = True
+    await session.post("messages", {"text": "You're welcome!"})
+    assert server.received == [("post", "messages", {"text": "You're welcome!"})]
+
+
+@pytest.mark.asyncio
+async def test_parks_updates_until_circuit_closes():
+    server = FailingServer()
+    session = BreakerSession(server, is_transient)
+
+    async def send(pet_id, update):
+        await session.patch("bots", pet_id, update)
+
+    update_queues = UpdateQueues(send)
+    for pet_id in range(6):
+        update_queues.add_update(pet_id, {"x": 1})
+    await asyncio.sleep(0.02)
+
+    assert session.breakers["bots update"].state == OPEN
+    assert update_queues.stats()["parked"] >= 1
+
+    # Updates for parked pets are coalesced while they wait.
+    for pet_id in range(6):
+        update_queues.add_update(pet_id, {"x": 2, "y": pet_id})
+    server.healthy = True
+
+    async def drained():
+        while update_queues.parked or update_queues.pending:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(drained(), 1)
+    await update_queues.close()
+
+    assert session.breakers["bots update"].state == CLOSED
+    final = {json["id"]: json for _, _, json in server.received}
+    # The first four were sent, and failed, before the circuit opened.
+    for pet_id in range(6):
+        assert final[pet_id] == {"id": pet_id, "x": 2, "y": pet_id}
+    assert len(server.received) == 6
@@ -0,0 +1,39 @@
+from pets import command_budget
+from pets.command_budget import ALLOW, IGNORE, WARN, CommandBudget
+
+
+def test_warns_once_then_ignores():
+    budget = CommandBudget(now=0)
+
+    assert [budget.check("eve", now=0) for _ in range(command_budget.USER_BURST)] == [
+        ALLOW
+    ] * command_budget.USER_BURST
+    assert budget.check("eve", now=0) == WARN
+    assert budget.check("eve", now=0) == IGNORE
+    # Someone else still has their own budget.
+    assert budget.check("bob", now=0) == ALLOW
+
+    assert budget.check("eve", now=1 / command_budget.USER_RATE) == ALLOW
+    assert budget.check("eve", now=1 / command_budget.USER_RATE) == WARN
+    assert budget.refused == 3
+
+
+def test_global_budget(monkeypatch):
+    monkeypatch.setattr(command_budget, "GLOBAL_BURST", 3)
+    budget = CommandBudget(now=0)
+
+    assert [budget.check(user, now=0) for user in range(4)] == [
+        ALLOW,
+        ALLOW,
+        ALLOW,
+        IGNORE,
+    ]
+
+
+def test_forgets_idle_users():
+    budget = CommandBudget(now=0)
+    budget.check("eve", now=0)
+    assert len(budget) == 1
+
+    budget.check("bob", now=command_budget.PRUNE_SECONDS)
+    assert len(budget) == 1
@@ -0,0 +1,39 @@
+from pets.geometry import Region, SpatialGrid, is_adjacent
+
+
+def test_near_matches_is_adjacent():
+    grid = SpatialGrid(cell_size=4)
+    points = [{"x": x, "y": y} for x in range(-10, 10) for y in range(-10, 10)]
+    for i, point in enumerate(points):
+        grid.move(i, point, point)
+
+    centre = {"x": 4, "y": -1}
+    assert sorted(map(str, grid.near(centre))) == sorted(
+        str(point) for point in points if is_adjacent(centre, point)
+    )
+
+
+def test_move_remove_and_occupancy():
+    grid = SpatialGrid(cell_size=4)
+
+    grid.move("a", {"x": 1, "y": 1}, "a")
+    grid.move("b", {"x": 1, "y": 1}, "b")
+    assert grid.occupied({"x": 1, "y": 1})
+
+    grid.move("a", {"x": 30, "y": 30}, "a")
+    assert grid.occupied({"x": 1, "y": 1})
+    assert list(grid.near({"x": 31, "y": 31})) == ["a"]
+
+    grid.remove("b")
+    assert not grid.occupied({"x": 1, "y": 1})
+    assert list(grid.near({"x": 1, "y": 1})) == []
+    assert len(grid) == 1
+
+
+def test_in_region():
+    grid = SpatialGrid(cell_size=4)
+    grid.move("inside", {"x": 5, "y": 5}, "inside")
+    grid.move("outside", {"x": 11, "y": 5}, "outside")
+
+    region = Region({"x": 0, "y": 0}, {"x": 10, "y": 10})
+    assert list(grid.in_region(region)) == ["inside"]
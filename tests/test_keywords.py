@@ -0,0 +1,33 @@
+import re
+
+import pytest
+
+from pets.constants import MANNERS
+from pets.keywords import MANNERS_MATCHER, trie_pattern
+
+
+def test_trie_pattern_matches_each_phrase():
+    pattern = re.compile(trie_pattern(["he", "she", "his", "hers", "ushers"]))
+
+    assert pattern.findall("ushers and his") == ["ushers", "his"]
+    assert pattern.findall("she, he, hers") == ["she", "he", "hers"]
+    assert pattern.findall("xyz") == []
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "adopt the dragon PLEASE",
+        "adopt the dragon, S'IL VOUS PLAÎT",
+        "ПОЖАЛУЙСТА, adopt a pet",
+        "sudo adopt a cat",
+        "Oh Mighty Djinn, adopt the owl",
+        "adopt the unicorn now, you stupid genie",
+        "pleas",
+        "",
+    ],
+)
+def test_matches_manners_like_substring_search(text):
+    expected = any(please in text.lower() for please in MANNERS)
+
+    assert bool(MANNERS_MATCHER.search(text.lower())) == expected
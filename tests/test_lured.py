@@ -0,0 +1,43 @@
+from collections import namedtuple
+
+import pets.lured
+from pets.lured import Lured
+
+FakePet = namedtuple("FakePet", ("id",))
+
+
+def test_expired_lures_are_purged_in_bulk(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pets.lured.time, "time", lambda: now[0])
+    monkeypatch.setattr(pets.lured, "LURE_TIME_SECONDS", 10)
+
+    lured = Lured()
+    for pet_id in range(5):
+        lured.add(FakePet(pet_id), {"id": "alice"})
+    now[0] += 5
+    lured.add(FakePet(99), {"id": "bob"})
+
+    assert len(lured.get_by_petter("alice")) == 5
+
+    now[0] += 6
+    assert lured.get_by_petter("alice") == []
+    assert lured.get_by_petter("bob") == [FakePet(99)]
+    assert "alice" not in lured.by_petter
+    assert len(lured) == 1
+
+
+def test_relure_moves_pet_to_new_petter(monkeypatch):
+    monkeypatch.setattr(pets.lured, "LURE_TIME_SECONDS", 600)
+
+    lured = Lured()
+    cat = FakePet(1)
+    lured.add(cat, {"id": "alice"})
+    lured.add(cat, {"id": "bob"})
+
+    assert lured.check(cat)
+    assert lured.get_by_petter("alice") == []
+    assert lured.get_by_petter("bob") == [cat]
+
+    lured.remove(cat)
+    assert not lured.check(cat)
+    assert not lured.by_petter
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+import rctogether
+
+from pets import Agency, metrics
+from pets.metrics import MeteredSession, Registry
+from pets.stand_in import StandInSession
+from pets.transport import RequestTimeout
+
+
+class FailingSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    async def patch(self, path, bot_id, json):
+        status = self.statuses.pop(0)
+        if status != 200:
+            raise rctogether.api.HttpError(status, "Unprocessable Entity")
+        return json
+
+
+def test_render():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.", ("verb",))
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    registry.callback("depth", "Depth.", lambda: 3)
+
+    counter.inc("get")
+    counter.inc("get")
+    counter.inc('we"ird')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{verb="get"} 2.0',
+        'requests_total{verb="we\\"ird"} 1.0',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1.0',
+        'latency_seconds_bucket{le="1.0"} 2.0',
+        'latency_seconds_bucket{le="+Inf"} 3.0',
+        "latency_seconds_count 3.0",
+        "latency_seconds_sum 5.55",
+        "# HELP depth Depth.",
+        "# TYPE depth gauge",
+        "depth 3.0",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_metered_session_counts_errors_by_status():
+    session = MeteredSession(FailingSession([200, 422]))
+    requests_before = metrics.REST_REQUESTS.values.get(("patch",), 0)
+    errors_before = metrics.HTTP_ERRORS.values.get((422,), 0)
+
+    await session.patch("bots", 1, {"x": 1})
+    with pytest.raises(rctogether.api.HttpError):
+        await session.patch("bots", 1, {"x": 1})
+
+    assert metrics.REST_REQUESTS.values[("patch",)] == requests_before + 2
+    assert metrics.HTTP_ERRORS.values[(422,)] == errors_before + 1
+
+
+@pytest.mark.asyncio
+async def test_serves_metrics():
+    registry = Registry()
+    registry.callback("pets", "Pets.", lambda: 7)
+    server = await metrics.serve(0, registry=registry)
+    port = server.sockets[0].getsockname()[1]
+
+    async def fetch(path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    try:
+        response = await fetch("/metrics")
+        assert response.startswith("HTTP/1.1 200 OK")
+        assert response.endswith("pets 7.0\n")
+
+        assert (await fetch("/")).startswith("HTTP/1.1 404")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_watch_agency():
+    genie = {
+        "type": "Bot",
+        "id": 1,
+        "name": "Genie",
+        "emoji": "🧞",
+        "pos": {"x": 0, "y": 0},
+    }
+    agency = await Agency.create(StandInSession([genie]))
+    await agency.handle_entity(
+        {"type": "Avatar", "id": 7, "person_name": "Faker", "pos": {"x": 1, "y": 1}}
+    )
+    await agency.close()
+
+    registry = Registry()
+    metrics.watch_agency(agency, registry)
+    lines = registry.render().splitlines()
+
+    assert 'pets_entities_received_total{type="Avatar"} 1.0' in lines
+    assert "pets_avatars 1.0" in lines
+    assert "pets_update_queues_pending 0.0" in lines
+    assert 'pets_update_queues_pending_by_lane{lane="wander"} 0.0' in lines
+
+
+@pytest.mark.asyncio
+async def test_watch_agency_reads_stats_once_per_scrape():
+    agency = await Agency.create(StandInSession([]))
+    await agency.close()
+    calls = []
+    stats = agency.stats
+    agency.stats = lambda: calls.append(1) or stats()
+
+    registry = Registry()
+    metrics.watch_agency(agency, registry)
+    registry.render()
+
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_metered_session_labels_timeouts():
+    class TimingOutSession:
+        async def post(self, path, json):
+            raise RequestTimeout(None, "post timed out")
+
+    session = MeteredSession(TimingOutSession())
+    before = metrics.HTTP_ERRORS.values.get(("timeout",), 0)
+
+    with pytest.raises(RequestTimeout):
+        await session.post("messages", {"text": "hi"})
+
+    assert metrics.HTTP_ERRORS.values[("timeout",)] == before + 1
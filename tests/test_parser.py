@@ -1,5 +1,8 @@
+import json
+from pathlib import Path
+
 import pytest
-from pets.parser import parse_command
+from pets.parser import parse_adoption, parse_command
 
 
 @pytest.mark.parametrize(
@@ -30,3 +33,37 @@ def test_adoption_phrase_parsing(phrase, expected_animal):
     assert (
         animal_type == expected_animal
     ), f"Expected {expected_animal}, got {animal_type} for: {phrase}"
+
+
+with open(Path(__file__).parent / "parser_corpus.json", encoding="utf-8") as corpus:
+    PARSER_CORPUS = json.load(corpus)
+
+
+@pytest.mark.parametrize("message,expected", PARSER_CORPUS)
+def test_parser_corpus(message, expected):
+    """Parse results are locked in by the corpus, including command priority."""
+    assert json.loads(json.dumps(parse_command(message))) == expected
+
+
+@pytest.mark.parametrize("message,expected", PARSER_CORPUS)
+def test_parse_adoption_agrees_with_dispatcher(message, expected):
+    adoption = parse_adoption(message)
+    if expected and expected[0] == "adoption":
+        assert list(adoption) == expected[1]
+    else:
+        assert adoption is None
+
+
+@pytest.mark.parametrize(
+    "message,expected",
+    [
+        # Keywords that overlap ("help" and "pet the ") are both found.
+        ("helpet the dog", ("pet_a_pet", ("dog",))),
+        ("backseat drivinget my cat", ("day_care_pick_up", ("cat",))),
+        ("HELPICK UP MY dog", ("day_care_pick_up", ("dog",))),
+        # Non-ASCII text before the keyword.
+        ("Straße, abandon my cat", ("abandon", ("cat",))),
+    ],
+)
+def test_dispatcher_edge_cases(message, expected):
+    assert parse_command(message) == expected
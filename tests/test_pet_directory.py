@@ -0,0 +1,71 @@
+import itertools
+
+from pets.constants import PETS
+from pets.pet import Pet
+from pets.pet_directory import PetDirectory
+
+
+def available_pet(pet_id, species, x):
+    return Pet(
+        {
+            "id": pet_id,
+            "name": species["name"],
+            "emoji": species["emoji"],
+            "pos": {"x": x, "y": 0},
+        }
+    )
+
+
+def test_indexes_follow_adds_removes_and_renames():
+    directory = PetDirectory()
+    pets = [
+        available_pet(pet_id, species, pet_id)
+        for pet_id, species in zip(itertools.count(), PETS[:10])
+    ]
+    for pet in pets:
+        directory.add(pet)
+
+    for pet in pets[::2]:
+        directory.remove(pet)
+
+    remaining = pets[1::2]
+    assert {directory.random_available().id for _ in range(200)} == {
+        pet.id for pet in remaining
+    }
+    assert set(directory.available_emojis()) == {pet.emoji for pet in remaining}
+    assert directory.available_of_type(pets[0].type) is None
+    assert directory.available_of_type(pets[1].type) is pets[1]
+
+    directory.rename(pets[1], "seahorse")
+    assert directory.available_of_type("seahorse") is pets[1]
+    assert directory.available_of_type(PETS[1]["name"]) is None
+
+    directory.set_owner(pets[1], {"id": 42})
+    assert directory.available_of_type("seahorse") is None
+    assert list(directory.owned(42)) == [pets[1]]
+
+
+def test_random_available_when_empty():
+    assert PetDirectory().random_available() is None
+
+
+def test_ownership_lookups_do_not_allocate():
+    directory = PetDirectory()
+    cat = available_pet(1, PETS[5], 1)
+    dog = available_pet(2, PETS[10], 2)
+    directory.add(cat)
+    directory.add(dog)
+
+    for avatar_id in range(100):
+        assert not directory.owned(avatar_id)
+    assert directory._owned_pets == {}
+
+    directory.set_owner(cat, {"id": 7})
+    directory.set_owner(dog, {"id": 7})
+    assert directory.owned_count(7) == 2
+    assert list(directory.owned(7)) == [cat, dog]
+
+    directory.set_owner(cat, {"id": 8})
+    directory.remove(dog)
+    assert directory.owned_count(7) == 0
+    assert list(directory._owned_pets) == [8]
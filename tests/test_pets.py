@@ -1,11 +1,14 @@
 from collections import namedtuple
 import asyncio
+import json
 import itertools
 from datetime import datetime, timezone
 
+import aiohttp
 import pytest
 
 from pets import Agency
+from pets.agency_sync import AgencySync
 from pets.constants import (
     PETS,
     SPAWN_POINTS,
@@ -772,3 +775,151 @@ async def test_basic_messages_user_with_no_pets(
         await agency.handle_entity(incoming_message(petless_person, genie, message))
 
     assert await session.message_received(genie, petless_person) == response
+
+
+@pytest.mark.asyncio
+async def test_warm_start_from_snapshot(tmp_path, genie, rocket, owned_cat, person):
+    owned_cat = {**owned_cat, "id": 4242}
+    snapshot_path = tmp_path / "bots.json"
+    snapshot_path.write_text(json.dumps([genie, rocket]))
+
+    moved_rocket = {**rocket, "pos": {"x": 2, "y": 2}}
+    session = MockSession({"bots": [genie, moved_rocket, owned_cat]})
+
+    agency = await Agency.create(session, snapshot_path=snapshot_path)
+    pet_directory = agency.agency_sync.pet_directory
+
+    # Serving straight from the snapshot, before the listing has arrived.
+    assert agency.agency_sync.genie.id == genie["id"]
+    assert pet_directory[rocket["id"]].pos == rocket["pos"]
+    assert owned_cat["id"] not in pet_directory.ids()
+
+    await agency.close()
+
+    assert pet_directory[rocket["id"]].pos == moved_rocket["pos"]
+    assert [pet.id for pet in pet_directory.owned(person["id"])] == [owned_cat["id"]]
+    assert json.loads(snapshot_path.read_text()) == session.get_data["bots"]
+
+
+@pytest.mark.asyncio
+async def test_resync_forgets_deleted_pets(genie, rocket, owned_cat, person):
+    owned_cat = {**owned_cat, "id": 4242}
+    session = MockSession({"bots": [genie, rocket, owned_cat]})
+
+    async with await Agency.create(session) as agency:
+        session.get_data["bots"] = [genie, rocket]
+        await agency.resync()
+
+    pet_directory = agency.agency_sync.pet_directory
+    assert owned_cat["id"] not in pet_directory.ids()
+    assert not pet_directory.owned(person["id"])
+    assert not session.pending_requests()
+
+
+@pytest.mark.asyncio
+async def test_restocks_are_coalesced(genie, person):
+    session = MockSession({"bots": [genie]})
+
+    async with await Agency.create(session) as agency:
+        await agency.handle_entity(incoming_message(person, genie, "Time to restock!"))
+        await agency.handle_entity(
+            incoming_message(person, genie, "Time to restock!", dt=1)
+        )
+
+    assert len(agency.agency_sync.pet_directory.available()) == len(SPAWN_POINTS)
+    assert await session.message_received(genie, person) == "New pets now in stock!"
+    assert (
+        await session.message_received(genie, person)
+        == "I've only just restocked, the new pets are on their way!"
+    )
+
+
+@pytest.mark.asyncio
+async def test_resync_keeps_pets_created_during_fetch(genie, rocket):
+    session = MockSession({"bots": [genie, rocket]})
+    new_pet = {**rocket, "id": 4343, "pos": {"x": 3, "y": 3}}
+
+    async with await Agency.create(session) as agency:
+        listing = session.get_data["bots"]
+
+        async def slow_get(path):
+            # The pet is created after the listing was taken.
+            agency.agency_sync.handle_created(new_pet)
+            return listing
+
+        session.get = slow_get
+        await agency.resync()
+
+    assert new_pet["id"] in agency.agency_sync.pet_directory.ids()
+    assert not agency.agency_sync.fetches
+
+
+@pytest.mark.asyncio
+async def test_resync_keeps_pets_abandoned_during_fetch(genie, owned_cat, person):
+    session = MockSession({"bots": [genie, owned_cat]})
+
+    async with await Agency.create(session) as agency:
+        listing = session.get_data["bots"]
+
+        async def slow_get(path):
+            # The cat is abandoned after the listing was taken.
+            agency.agency_sync.handle_abandon(person, "cat")
+            return listing
+
+        session.get = slow_get
+        await agency.resync()
+
+    assert owned_cat["id"] not in agency.agency_sync.pet_directory.ids()
+
+
+@pytest.mark.asyncio
+async def test_resync_keeps_pets_adopted_during_fetch(genie, rocket, person):
+    session = MockSession({"bots": [genie, rocket]})
+
+    async with await Agency.create(session) as agency:
+        listing = session.get_data["bots"]
+
+        async def slow_get(path):
+            # The rocket is adopted after the listing was taken.
+            list(
+                agency.agency_sync.handle_adoption(
+                    person, "adopt the rocket, please", "rocket"
+                )
+            )
+            return listing
+
+        session.get = slow_get
+        await agency.resync()
+
+    assert [pet.id for pet in agency.agency_sync.pet_directory.owned(person["id"])] == [
+        rocket["id"]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_background_resync_survives_network_errors(tmp_path, genie):
+    snapshot_path = tmp_path / "bots.json"
+    snapshot_path.write_text(json.dumps([genie]))
+    session = MockSession({})
+
+    async def unreachable(path):
+        raise aiohttp.ClientConnectionError("no route to host")
+
+    session.get = unreachable
+
+    async with await Agency.create(session, snapshot_path=snapshot_path) as agency:
+        pass
+
+    assert agency._resync_task.exception() is None
+    assert agency.agency_sync.genie.id == genie["id"]
+
+
+def test_mentions_are_ignored_until_the_genie_exists(genie, person):
+    # A warm start can load a snapshot taken before the genie was created.
+    agency_sync = AgencySync()
+    agency_sync.load([])
+    message = incoming_message(person, genie, "thanks!")["message"]
+
+    assert not list(
+        agency_sync.handle_mention(person, message, message["mentioned_entity_ids"])
+    )
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from pets.pipeline import IngestPipeline
+
+
+@pytest.mark.asyncio
+async def test_slow_lane_does_not_block_others():
+    dispatched = []
+    release = asyncio.Event()
+
+    def process(entity):
+        return [(entity["id"], (entity["id"], entity["n"]))]
+
+    async def dispatch(event):
+        if event == ("slow", 0):
+            await release.wait()
+        dispatched.append(event)
+
+    pipeline = IngestPipeline(process, dispatch)
+
+    await pipeline.put({"id": "slow", "n": 0})
+    await pipeline.put({"id": "slow", "n": 1})
+    for n in range(3):
+        await pipeline.put({"id": "fast", "n": n})
+
+    await asyncio.sleep(0.01)
+    assert dispatched == [("fast", 0), ("fast", 1), ("fast", 2)]
+    assert pipeline.stats()["dispatch_depth"] == 2
+
+    release.set()
+    await pipeline.close()
+
+    assert dispatched[3:] == [("slow", 0), ("slow", 1)]
+    assert pipeline.stats()["dispatch_depth"] == 0
+    assert not pipeline.lanes
+
+
+@pytest.mark.asyncio
+async def test_max_lag_is_reset_when_read():
+    async def dispatch(event):
+        pass
+
+    pipeline = IngestPipeline(lambda entity: [(entity["id"], entity)], dispatch)
+    pipeline.max_lag = 5.0
+
+    assert pipeline.stats()["max_lag"] == 5.0
+    assert pipeline.stats()["max_lag"] == 0.0
+
+    await pipeline.put({"id": "a"})
+    await pipeline.join()
+    assert pipeline.stats()["max_lag"] < 5.0
+
+    await pipeline.close()
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pets.agency_sync import AgencySync
+from pets.parser import parse_command
+from pets.profiler import Profiler, Sampler
+
+
+def test_attributes_samples():
+    sampler = Sampler(threading.get_ident(), interval=0.001)
+    sync = AgencySync()
+
+    sampler.start(seconds=5)
+    deadline = time.monotonic() + 0.3
+    while time.monotonic() < deadline:
+        parse_command("May I please adopt the dragon?")
+        sync.handle_thanks({"id": 1})
+    sampler.stop()
+
+    categories = sampler.categories()
+    assert sampler.samples > 0
+    assert categories["parse_command"] > 0
+    assert set(categories) <= {"parse_command", "AgencySync.handle_thanks", "other"}
+
+    for line in sampler.collapsed().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("[")
+        assert int(count) > 0
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint(tmp_path):
+    profiler = Profiler(threading.get_ident(), directory=str(tmp_path))
+
+    status, body = await profiler.handle_request("seconds=0.2")
+
+    assert status == "200 OK"
+    assert "[idle]" in body or "[other]" in body
+    assert len(list(tmp_path.glob("pets-profile-*.folded"))) == 1
+
+    status, _ = await profiler.handle_request("seconds=soon")
+    assert status == "400 Bad Request"
+
+
+@pytest.mark.asyncio
+async def test_idle_time_with_requests_in_flight_is_io():
+    sampler = Sampler(threading.get_ident(), interval=0.001, in_flight=lambda: 1)
+
+    sampler.start(seconds=5)
+    await asyncio.sleep(0.2)
+    sampler.stop()
+
+    categories = sampler.categories()
+    assert categories["rctogether I/O"] > 0
+    assert "idle" not in categories
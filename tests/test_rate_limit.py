@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+import rctogether
+
+from pets import priority
+from pets.rate_limit import RateLimiter, RateLimitedSession
+
+
+class ThrottlingSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.rc_app_id = "test"
+
+    async def patch(self, path, bot_id, json):
+        status = self.statuses.pop(0)
+        if status != 200:
+            raise rctogether.api.HttpError(status, "Too Many Requests")
+        return json
+
+
+@pytest.mark.asyncio
+async def test_limits_request_rate():
+    limiter = RateLimiter(rate=50, burst=1)
+
+    started = time.monotonic()
+    for _ in range(6):
+        await limiter.acquire()
+
+    assert time.monotonic() - started >= 0.09
+    assert limiter.last_wait > 0
+
+
+@pytest.mark.asyncio
+async def test_backs_off_when_throttled():
+    session = RateLimitedSession(
+        ThrottlingSession([429, 200]), RateLimiter(rate=10, min_rate=1)
+    )
+
+    with pytest.raises(rctogether.api.HttpError):
+        await session.patch("bots", 1, {})
+    assert session.limiter.rate == 5
+
+    assert await session.patch("bots", 1, {"x": 1}) == {"x": 1}
+    assert 5 < session.limiter.rate < 10
+
+    assert session.rc_app_id == "test"
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_counted():
+    limiter = RateLimiter(rate=20, burst=1)
+
+    await limiter.acquire()
+    waiters = [asyncio.create_task(limiter.acquire()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == 3
+
+    await asyncio.gather(*waiters)
+    assert limiter.stats()["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_replies_overtake_queued_moves():
+    limiter = RateLimiter(rate=100, burst=1)
+    served = []
+
+    async def request(name, lane):
+        await limiter.acquire(lane)
+        served.append(name)
+
+    await limiter.acquire()
+    moves = [
+        asyncio.create_task(request(f"move {n}", priority.FOLLOW)) for n in range(4)
+    ]
+    await asyncio.sleep(0)
+    reply = asyncio.create_task(request("reply", priority.REPLY))
+
+    await asyncio.gather(reply, *moves)
+    assert served.index("reply") <= 1
+    assert limiter.stats()["waiting_by_lane"]["follow"] == 0
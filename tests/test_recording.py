@@ -0,0 +1,90 @@
+import gzip
+
+import pytest
+
+from pets import Agency
+from pets.recording import Recorder, read, recording_files, replay
+from pets.stand_in import StandInSession
+
+GENIE = {
+    "type": "Bot",
+    "id": 1,
+    "name": "Pet Agency Genie",
+    "emoji": "🧞",
+    "pos": {"x": 60, "y": 15},
+}
+
+
+def avatar(sent_at, text):
+    return {
+        "type": "Avatar",
+        "id": 7,
+        "person_name": "Faker McFakeface",
+        "pos": {"x": 10, "y": 10},
+        "message": {
+            "mentioned_entity_ids": [GENIE["id"]],
+            "sent_at": sent_at,
+            "text": text,
+        },
+    }
+
+
+def test_round_trip_with_rotation(tmp_path):
+    prefix = str(tmp_path / "recordings" / "entities")
+    recorder = Recorder(prefix, max_bytes=200, max_files=2)
+    for index in range(10):
+        recorder.record({"type": "Bot", "id": index, "name": "🐈"}, now=index)
+    recorder.close()
+
+    paths = recording_files(prefix)
+    assert len(paths) == 2
+    records = list(read(paths))
+    ids = [entity["id"] for _, entity in records]
+    # The oldest files have been deleted, and what's left is in order.
+    assert ids == list(range(ids[0], 10))
+    assert ids[0] > 0
+    assert [arrived_at for arrived_at, _ in records] == ids
+    assert records[0][1]["name"] == "🐈"
+
+
+def test_read_stops_at_truncation(tmp_path):
+    prefix = str(tmp_path / "entities")
+    recorder = Recorder(prefix)
+    for index in range(100):
+        recorder.record({"type": "Bot", "id": index}, now=index)
+    recorder.close()
+
+    (path,) = recording_files(prefix)
+    with open(path, "rb") as recording:
+        data = recording.read()
+    with open(path, "wb") as recording:
+        recording.write(data[: len(data) // 2])
+
+    records = list(read([path]))
+    assert len(records) < 100
+    assert [entity["id"] for _, entity in records] == list(range(len(records)))
+
+    with pytest.raises(EOFError):
+        with gzip.open(path) as recording:
+            recording.read()
+
+
+@pytest.mark.asyncio
+async def test_replay_skips_messages_from_before_the_recording(monkeypatch):
+    monkeypatch.setattr("pets.update_queues.SLEEP_AFTER_UPDATE", 0.01)
+    session = StandInSession([GENIE])
+    agency = await Agency.create(session)
+
+    # 2024-01-01T00:00:00Z
+    start = 1704067200
+    records = [
+        (start, avatar("2023-12-31T23:59:59Z", "thanks!")),
+        (start + 1, avatar("2024-01-01T00:00:01Z", "thanks!")),
+        (start + 2, avatar("2024-01-01T00:00:01Z", "thanks!")),
+    ]
+
+    result = await replay(agency, records, speed=None)
+    await agency.close()
+
+    assert result["entities"] == 3
+    assert session.calls[("post", "messages")] == 1
@@ -0,0 +1,40 @@
+import pytest
+
+import pets.subscription
+from pets.subscription import supervised_subscription
+
+pets.subscription.RECONNECT_DELAY = 0.001
+
+
+class FlakySubscription:
+    def __init__(self, connections):
+        self.connections = list(connections)
+
+    def __call__(self):
+        return self.connect(self.connections.pop(0))
+
+    async def connect(self, entities):
+        for entity in entities:
+            if isinstance(entity, Exception):
+                raise entity
+            yield entity
+
+
+@pytest.mark.asyncio
+async def test_reconnects_and_resyncs():
+    subscribe = FlakySubscription(
+        [[1, 2, OSError("connection reset")], [ConnectionError("refused")], [3], [4]]
+    )
+    resyncs = []
+
+    async def on_reconnect():
+        resyncs.append(len(resyncs))
+
+    received = []
+    async for entity in supervised_subscription(on_reconnect, subscribe):
+        received.append(entity)
+        if entity == 4:
+            break
+
+    assert received == [1, 2, 3, 4]
+    assert len(resyncs) == 3
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from pets.timer_wheel import TimerWheel
+
+
+@pytest.mark.asyncio
+async def test_fires_expired_timers_in_one_tick():
+    fired = []
+    wheel = TimerWheel(fired.append, tick=0.01)
+
+    for key in range(1000):
+        wheel.reset(key, 0.02)
+    wheel.reset("late", 1)
+
+    await asyncio.sleep(0.1)
+
+    assert sorted(fired) == list(range(1000))
+    assert len(wheel) == 1
+    wheel.clear()
+
+
+@pytest.mark.asyncio
+async def test_reset_and_cancel():
+    fired = []
+    wheel = TimerWheel(fired.append, tick=0.01)
+
+    wheel.reset("reset", 0.02)
+    wheel.reset("cancelled", 0.02)
+    wheel.cancel("cancelled")
+    wheel.reset("reset", 0.2)
+
+    await asyncio.sleep(0.1)
+    assert fired == []
+
+    await asyncio.sleep(0.2)
+    assert fired == ["reset"]
+    assert wheel.handle is None
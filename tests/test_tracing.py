@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from pets import Agency
+from pets.stand_in import StandInSession
+from pets.tracing import TracedSession, Tracer
+
+GENIE = {
+    "type": "Bot",
+    "id": 1,
+    "name": "Pet Agency Genie",
+    "emoji": "🧞",
+    "pos": {"x": 60, "y": 15},
+}
+
+OWNED_CAT = {
+    "type": "Bot",
+    "id": 2,
+    "name": "Faker McFakeface's cat",
+    "emoji": "🐈",
+    "pos": {"x": 1, "y": 1},
+    "message": {
+        "mentioned_entity_ids": [7],
+        "text": "@**Faker McFakeface** miaow!",
+    },
+}
+
+
+def owner(text=None):
+    entity = {
+        "type": "Avatar",
+        "id": 7,
+        "person_name": "Faker McFakeface",
+        "pos": {"x": 10, "y": 10},
+    }
+    if text:
+        entity["message"] = {
+            "mentioned_entity_ids": [GENIE["id"]],
+            "sent_at": "2033-11-13T12:00:00Z",
+            "text": text,
+        }
+    return entity
+
+
+def read_trace(path):
+    with open(path, encoding="utf-8") as trace_file:
+        return json.loads(trace_file.read().rstrip().rstrip(",") + "]")
+
+
+async def run_agency(tracer, entities):
+    session = TracedSession(StandInSession([GENIE, OWNED_CAT]))
+    agency = await Agency.create(session, tracer=tracer)
+    for entity in entities:
+        await agency.handle_entity(entity)
+    await agency.close()
+    tracer.close()
+
+
+@pytest.mark.asyncio
+async def test_traces_entity_to_rest_calls(tmp_path, monkeypatch):
+    monkeypatch.setattr("pets.update_queues.SLEEP_AFTER_UPDATE", 0.01)
+    path = tmp_path / "trace.json"
+
+    await run_agency(Tracer(path, sample_rate=1), [owner("thanks!")])
+
+    events = read_trace(path)
+    assert events[0]["ph"] == "i"
+    assert events[0]["args"]["entity"]["id"] == 7
+
+    names = [event["name"] for event in events]
+    for name in [
+        "intake wait",
+        "process",
+        "dispatch wait",
+        "send_message",
+        "POST messages",
+        "update_pet",
+        "update queue wait",
+        "PATCH bots",
+        "send update",
+    ]:
+        assert name in names
+    assert {event["tid"] for event in events} == {1}
+
+
+@pytest.mark.asyncio
+async def test_unsampled_entities_are_not_traced(tmp_path, monkeypatch):
+    monkeypatch.setattr("pets.update_queues.SLEEP_AFTER_UPDATE", 0.01)
+    path = tmp_path / "trace.json"
+
+    await run_agency(Tracer(path, sample_rate=0), [owner("thanks!"), owner()])
+
+    assert read_trace(path) == []
+
+
+def test_buffers_and_rotates(tmp_path):
+    path = tmp_path / "trace.json"
+    tracer = Tracer(path, sample_rate=1, max_bytes=1000)
+
+    trace = tracer.start(owner())
+    trace.add_span("process", 0.0, 1.0)
+    # Nothing is written until a flush.
+    assert read_trace(path) == []
+
+    for _ in range(20):
+        trace.add_span("process", 0.0, 1.0)
+        tracer.flush()
+    tracer.close()
+
+    assert (tmp_path / "trace.json.1").exists()
+    assert len(read_trace(tmp_path / "trace.json.1")) >= 1
+    assert all(event["name"] == "process" for event in read_trace(path))
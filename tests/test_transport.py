@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+import rctogether
+
+from pets import transport
+from pets.rate_limit import RateLimiter
+from pets.transport import BlockedPosition, RequestTimeout, wrap
+
+transport.RETRY_DELAY = 0.001
+
+
+class ScriptedSession:
+    """Answers each call with the next response: a status, or "hang"."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    async def _respond(self, method):
+        self.calls.append(method)
+        response = self.responses.pop(0)
+        if response == "hang":
+            await asyncio.sleep(10)
+        if response != 200:
+            raise rctogether.api.HttpError(response, "must not be in a block")
+        return {}
+
+    async def post(self, resource, json):
+        return await self._respond("post")
+
+    async def patch(self, resource, resource_id, json):
+        return await self._respond("patch")
+
+    async def delete(self, resource, resource_id, json=None):
+        return await self._respond("delete")
+
+
+def stack(responses):
+    raw = ScriptedSession(responses)
+    return raw, wrap(raw, limiter=RateLimiter(rate=1000))
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_patch_failures():
+    raw, session = stack([503, 502, 200])
+
+    await session.patch("bots", 1, {"x": 1})
+
+    assert raw.calls == ["patch"] * 3
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    raw, session = stack([503] * (transport.MAX_RETRIES + 1))
+
+    with pytest.raises(rctogether.api.HttpError):
+        await session.patch("bots", 1, {"x": 1})
+
+    assert len(raw.calls) == transport.MAX_RETRIES + 1
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_post():
+    raw, session = stack([503, 200])
+
+    with pytest.raises(rctogether.api.HttpError):
+        await session.post("messages", {"text": "hi"})
+
+    assert raw.calls == ["post"]
+
+
+@pytest.mark.asyncio
+async def test_classifies_blocked_positions():
+    raw, session = stack([422])
+
+    with pytest.raises(BlockedPosition) as exc_info:
+        await session.patch("bots", 1, {"x": 1})
+
+    assert isinstance(exc_info.value, rctogether.api.HttpError)
+    assert raw.calls == ["patch"]
+
+
+@pytest.mark.asyncio
+async def test_retried_delete_of_missing_bot_succeeds(monkeypatch):
+    monkeypatch.setattr(transport, "REQUEST_TIMEOUT", 0.01)
+    raw, session = stack(["hang", 404])
+
+    assert await session.delete("bots", 1) == {}
+    assert raw.calls == ["delete", "delete"]
+
+
+@pytest.mark.asyncio
+async def test_times_out(monkeypatch):
+    monkeypatch.setattr(transport, "REQUEST_TIMEOUT", 0.01)
+    raw, session = stack(["hang"])
+
+    with pytest.raises(RequestTimeout):
+        await session.post("messages", {"text": "hi"})
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_when_budget_is_spent():
+    raw, session = stack([503, 503, 200])
+    session.retry_tokens = 0
+
+    with pytest.raises(rctogether.api.HttpError):
+        await session.patch("bots", 1, {"x": 1})
+
+    assert raw.calls == ["patch"]
@@ -1,76 +1,172 @@
 import asyncio
 import pytest
-from pets.update_queues import UpdateQueues, deduplicated_updates
+from pets.update_queues import UpdateQueues
 import pets.update_queues
+from pets import priority
 
 pets.update_queues.SLEEP_AFTER_UPDATE = 0.01
 
 
-@pytest.mark.asyncio
-async def test_task_order_preservation():
-    update_queues = UpdateQueues(deduplicated_updates)
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, queue_id, update):
+        self.sent.append((queue_id, update))
 
-    results = []
 
-    async def mock_task(number):
-        results.append(number)
-        return number
+@pytest.mark.asyncio
+async def test_update_order_preservation():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send)
 
     queue_id = "test_queue"
-    task_ids = [1, 2, 3]
-    for number in task_ids:
-        await update_queues.add_task(queue_id, mock_task(number))
+    for number in [1, 2, 3]:
+        update_queues.add_update(queue_id, {"x": number})
         await asyncio.sleep(0.10)
 
     await update_queues.close()
 
-    assert results == task_ids, "Tasks are not processed in the order they were added"
+    assert recorder.sent == [
+        (queue_id, {"x": 1}),
+        (queue_id, {"x": 2}),
+        (queue_id, {"x": 3}),
+    ], "Updates are not sent in the order they were added"
 
 
 @pytest.mark.asyncio
-async def test_task_deduplication():
-    update_queues = UpdateQueues(deduplicated_updates)
+async def test_update_coalescing():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send)
 
-    tasks_processed = []
+    queue_id = "test_queue"
+    for number in range(9):
+        update_queues.add_update(queue_id, {"x": number, "y": number})
+    await update_queues.close()
 
-    async def mock_task(task_id):
-        await asyncio.sleep(0.1)
-        tasks_processed.append(task_id)
+    assert recorder.sent == [(queue_id, {"x": 8, "y": 8})]
 
-    queue_id = "test_queue"
 
-    for task_id in range(9):
-        await update_queues.add_task(queue_id, mock_task(task_id))
+@pytest.mark.asyncio
+async def test_rename_survives_later_move():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send)
+
+    update_queues.add_update("pet", {"x": 1, "y": 1, "name": "Eve's cat"})
+    update_queues.add_update("pet", {"x": 2, "y": 2})
+    await update_queues.close()
+
+    assert recorder.sent == [("pet", {"x": 2, "y": 2, "name": "Eve's cat"})]
+
+
+@pytest.mark.asyncio
+async def test_state_is_reclaimed_when_idle():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send, workers=2)
+
+    for queue_id in range(100):
+        update_queues.add_update(queue_id, {"x": queue_id})
+
+    assert len(update_queues.workers) == 2
+
+    await update_queues.close()
+
+    assert sorted(queue_id for (queue_id, _) in recorder.sent) == list(range(100))
+    assert not update_queues.pending
+    assert not update_queues.active
+
+
+@pytest.mark.asyncio
+async def test_no_updates_after_remove():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send)
+
+    update_queues.add_update("pet", {"x": 1})
+    update_queues.remove("pet")
     await update_queues.close()
 
-    assert len(tasks_processed) == 1
+    assert recorder.sent == []
 
 
 @pytest.mark.asyncio
-async def test_queued_tasks_deduplication():
-    queue = asyncio.Queue()
+async def test_higher_priority_updates_are_sent_first():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send, workers=1)
 
-    updates = ["update1", "update2", "update3"]
-    for update in updates:
-        await queue.put(update)
+    for pet in range(3):
+        update_queues.add_update(f"wander {pet}", {"x": pet}, priority.WANDER)
+    update_queues.add_update("rename", {"name": "Eve's cat"}, priority.RENAME)
+    await update_queues.close()
+
+    assert [queue_id for queue_id, _ in recorder.sent] == [
+        "rename",
+        "wander 0",
+        "wander 1",
+        "wander 2",
+    ]
 
-    await queue.put(None)
 
-    yielded_updates = []
-    async for update in deduplicated_updates(queue):
-        yielded_updates.append(update)
+@pytest.mark.asyncio
+async def test_wanders_are_dropped_when_backed_up(monkeypatch):
+    monkeypatch.setattr(pets.update_queues, "MAX_READY_FOR_WANDERS", 2)
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send, workers=1)
+
+    for pet in range(3):
+        update_queues.add_update(pet, {"x": pet}, priority.FOLLOW)
+    update_queues.add_update("bored", {"x": 0}, priority.WANDER)
+    await update_queues.close()
 
-    assert yielded_updates == ["update3"]
+    assert "bored" not in [queue_id for queue_id, _ in recorder.sent]
+    assert update_queues.stats()["dropped"] == 1
 
 
 @pytest.mark.asyncio
-async def test_queued_tasks_sequencing():
-    queue = asyncio.Queue()
+async def test_queued_update_is_promoted_by_a_more_urgent_one():
+    recorder = Recorder()
+    update_queues = UpdateQueues(recorder.send, workers=1)
 
-    tasks = deduplicated_updates(queue)
+    update_queues.add_update("bored", {"x": 0}, priority.WANDER)
+    for pet in range(3):
+        update_queues.add_update(f"follow {pet}", {"x": pet}, priority.FOLLOW)
+    update_queues.add_update("bored", {"name": "Eve's cat"}, priority.RENAME)
 
-    await queue.put("update1")
-    assert await tasks.__anext__() == "update1"
+    lanes = []
+
+    async def send(queue_id, update):
+        lanes.append(priority.current())
+        await recorder.send(queue_id, update)
+
+    update_queues.send = send
+    await update_queues.close()
+
+    assert recorder.sent[0] == ("bored", {"x": 0, "name": "Eve's cat"})
+    assert lanes[0] == priority.RENAME
+    assert [queue_id for queue_id, _ in recorder.sent].count("bored") == 1
+    assert update_queues.stats()["ready"] == 0
+
+
+@pytest.mark.asyncio
+async def test_updates_merged_while_sending_wait_their_turn():
+    in_flight = []
+    overlapped = []
+    sent = []
+
+    async def send(queue_id, update):
+        overlapped.append(queue_id in in_flight)
+        in_flight.append(queue_id)
+        await asyncio.sleep(0.05)
+        in_flight.remove(queue_id)
+        sent.append((queue_id, update))
+
+    update_queues = UpdateQueues(send)
+    update_queues.add_update("pet", {"x": 1}, priority.FOLLOW)
+    await asyncio.sleep(0.01)
+    assert in_flight == ["pet"]
+
+    update_queues.add_update("pet", {"name": "Eve's cat"}, priority.RENAME)
+    update_queues.add_update("pet", {"x": 2}, priority.FOLLOW)
+    await update_queues.close()
 
-    await queue.put("update2")
-    assert await tasks.__anext__() == "update2"
+    assert not any(overlapped)
+    assert sent == [("pet", {"x": 1}), ("pet", {"name": "Eve's cat", "x": 2})]